@@ -1,24 +1,49 @@
 import os
+import io
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from itertools import islice
 from pathlib import Path
-import torch
 import numpy as np
 import pandas as pd
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response
 from flask_cors import CORS
-from fpdf import FPDF
-import matplotlib.pyplot as plt
 from flask_pymongo import PyMongo
-from werkzeug.security import generate_password_hash, check_password_hash
 from bson.json_util import dumps
 from bson.objectid import ObjectId
-from werkzeug.security import generate_password_hash
+from werkzeug.utils import secure_filename
 import jwt
 from flask import Blueprint, request, jsonify
-from werkzeug.security import check_password_hash
 from bson.objectid import ObjectId
 from flask_cors import cross_origin
 import jwt
 import datetime
+from config import Config
+from inference import run_detection, detections_to_list, render_overlay, jpeg_data_uri
+from preprocessing import INFER_SIZES, Preprocessor, check_infer_size, open_reduced
+from reports import build_detection_pdf, build_batch_pdf, build_recommendation_pdf
+from batching import MicroBatcher
+from detection_cache import DetectionCache
+from model_registry import ModelRegistry, UnknownModel
+from jobs import JobManager, QueueFull, WorkersUnavailable, run_detection_job
+from risk import (
+    RISK_SCORES, RECOMMENDATIONS, AXIAL_LENGTH_THRESHOLDS, REFRACTION_THRESHOLDS, VISUAL_ACUITY_THRESHOLDS,
+    risk_category, risk_summary, calculate_myopia_risk_batch
+)
+from streaming import not_modified, pdf_response
+from specialists import SpecialistStore, DuplicateSpecialist, mongo_client_options
+from passwords import PasswordHasher, HasherBusy
+from auth_cache import TTLCache, TokenVerifier
+from metrics import Metrics
+from retention import RetentionManager, RetentionPolicy
+from artifacts import ArtifactStore, is_artifact, request_key, content_key
+from charts import risk_chart_path, parse_risk_chart_key, render_risk_chart, risk_chart_image
 
 
 
@@ -28,10 +53,31 @@ import datetime
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-# MongoDB Configuration
+# Request timing middleware and per-stage spans, exposed on /metrics
+metrics = Metrics(enabled=Config.METRICS_ENABLED)
+metrics.init_app(app)
+
+# MongoDB Configuration; the client is opened per process by start_services(),
+# since a MongoClient created before fork() must not be used in the children
 app.config["MONGO_URI"] = "mongodb://localhost:27017/myopiadx"
 app.config["SECRET_KEY"] = "myopiadx-secret-key"
-mongo = PyMongo(app)
+app.config["MAX_CONTENT_LENGTH"] = int(Config.MAX_UPLOAD_MB * 1024 * 1024)
+mongo = PyMongo()
+token_verifier = TokenVerifier(
+    app.config["SECRET_KEY"],
+    expires_in=Config.JWT_EXPIRES_SECONDS,
+    cache_ttl=Config.TOKEN_CACHE_TTL,
+    max_entries=Config.AUTH_CACHE_MAX_ENTRIES
+)
+profile_cache = TTLCache(Config.PROFILE_CACHE_TTL, Config.AUTH_CACHE_MAX_ENTRIES)
+# Bound to this process's database by start_services()
+specialists = SpecialistStore(profile_cache=profile_cache)
+
+password_hasher = PasswordHasher(
+    method=Config.PASSWORD_HASH_METHOD,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING
+)
 
 # Create authentication blueprint
 auth = Blueprint('auth', __name__)
@@ -41,6 +87,11 @@ auth = Blueprint('auth', __name__)
 def parse_json(data):
     return dumps(data)
 
+def hasher_busy_response(e):
+    response = jsonify({"success": False, "message": f"Server busy, please retry later ({str(e)})"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     # Get registration data from request
@@ -52,16 +103,6 @@ def register():
         if not data.get(field):
             return jsonify({"success": False, "message": f"{field} is required"}), 400
     
-    # Check if user already exists with the email
-    existing_email = mongo.db.specialists.find_one({"email": data['email']})
-    if existing_email:
-        return jsonify({"success": False, "message": "Email already registered"}), 400
-    
-    # Check if user already exists with the medical ID
-    existing_medical_id = mongo.db.specialists.find_one({"medicalId": data['medicalId']})
-    if existing_medical_id:
-        return jsonify({"success": False, "message": "Medical ID already registered"}), 400
-    
     # Validate specialty
     specialties = [
         "Ophthalmology",
@@ -78,6 +119,11 @@ def register():
     if data['specialty'] not in specialties:
         return jsonify({"success": False, "message": "Invalid specialty"}), 400
     
+    try:
+        password_hash = password_hasher.hash(data['password'])
+    except HasherBusy as e:
+        return hasher_busy_response(e)
+    
     # Create new specialist object
     new_specialist = {
         "fullName": data['fullName'],
@@ -86,17 +132,17 @@ def register():
         "specialty": data['specialty'],
         "hospital": data.get('hospital', ''),
         "yearsOfExperience": data.get('yearsOfExperience', ''),
-        "password": generate_password_hash(data['password']),
-        "createdAt": datetime.now()
+        "password": password_hash,
+        "createdAt": datetime.datetime.now()
     }
     
-    # Insert new specialist into database
+    # Insert new specialist; the unique indexes reject a taken email or medical ID
     try:
-        result = mongo.db.specialists.insert_one(new_specialist)
+        specialist_id = specialists.create(new_specialist)
         
         # Create response object (without sensitive info)
         response_data = {
-            "id": str(result.inserted_id),
+            "id": specialist_id,
             "fullName": data['fullName'],
             "email": data['email']
         }
@@ -107,6 +153,9 @@ def register():
             "data": response_data
         }), 201
         
+    except DuplicateSpecialist as e:
+        message = "Email already registered" if e.field == "email" else "Medical ID already registered"
+        return jsonify({"success": False, "message": message}), 400
     except Exception as e:
         return jsonify({
             "success": False,
@@ -119,6 +168,13 @@ def register():
 def health_check():
     return jsonify({"status": "API is running"})
 
+# Readiness check route: 200 only once the model is loaded and warmed up
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    status = model_registry.loader(touch=False).status()
+    status["version"] = model_registry.active
+    return jsonify(status), 200 if status["ready"] else 503
+
 @app.route('/api/auth/login', methods=['POST'])
 @cross_origin()
 def login():
@@ -130,7 +186,7 @@ def login():
         return jsonify({'message': 'Email and password are required'}), 400
     
     # Find user by email in the correct collection
-    user = mongo.db.specialists.find_one({'email': data['email']})
+    user = specialists.find_for_login(data['email'])
     print(f"User found in database: {user is not None}")
     
     if not user:
@@ -138,15 +194,22 @@ def login():
         return jsonify({'message': 'User not found. Please check your email or sign up.'}), 404
     
     # Check password
-    password_match = check_password_hash(user['password'], data['password'])
+    try:
+        password_match, new_hash = password_hasher.verify(user['password'], data['password'])
+    except HasherBusy as e:
+        return hasher_busy_response(e)
     print(f"Password verification result: {password_match}")
     
+    # Upgrade hashes made with outdated parameters
+    if new_hash:
+        specialists.update_password(user['_id'], new_hash)
+    
     if password_match:
-        # Generate JWT token
-        token = jwt.encode({
+        # Generate JWT token, valid for JWT_EXPIRES_SECONDS
+        token = token_verifier.issue({
             'userId': str(user['_id']),
             'email': user['email'],
-        }, app.config['SECRET_KEY'], algorithm='HS256')
+        })
         
         print("Login successful, generating token")
         
@@ -181,23 +244,26 @@ def get_user(user_id):
         if token.startswith('Bearer '):
             token = token[7:]
         
-        # Decode token
-        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        # Decode token (verified claims are cached until the token expires)
+        data = token_verifier.verify(token)
         
         # Check if token is for requested user
         if data['userId'] != user_id:
             return jsonify({'message': 'Unauthorized access'}), 403
         
-        # Get user data from database
-        user = mongo.db.specialists.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            return jsonify({'message': 'User not found'}), 404
-        
-        # Remove password from response
-        user.pop('password', None)
-        user['_id'] = str(user['_id'])
+        body = profile_cache.get(user_id)
+        if body is None:
+            # Get user data from database
+            # Password hash is excluded by the projection
+            user = specialists.find_public(ObjectId(user_id))
+            if not user:
+                return jsonify({'message': 'User not found'}), 404
+            
+            user['_id'] = str(user['_id'])
+            body = jsonify(user).get_data()
+            profile_cache.put(user_id, body)
         
-        return jsonify(user), 200
+        return Response(body, status=200, mimetype='application/json')
         
     except jwt.ExpiredSignatureError:
         return jsonify({'message': 'Token has expired'}), 401
@@ -206,31 +272,8 @@ def get_user(user_id):
 
 
 
-class RecommendationPDF(FPDF):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        font_path = os.path.join(os.path.dirname(__file__), 'DejaVuSans.ttf')
-        
-        try:
-            self.add_font('DejaVu', '', font_path, uni=True)
-            self.add_font('DejaVu', 'B', font_path, uni=True)
-        except Exception as e:
-            print(f"Font loading error: {e}")
-            self.set_font('Arial', '', 12)
-
-    def header(self):
-        self.set_font('Arial', 'B', 14)
-        self.cell(0, 10, 'Myopia Treatment Recommendation', 0, 1, 'C')
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', '', 8)
-        self.cell(0, 10, f'Page {self.page_no()}/{{nb}}', 0, 0, 'C')
-
-
 # Defining paths
-MODEL_PATH = "../yolov5/runs/train/exp26/weights/best.pt"
+MODEL_PATH = Config.MODEL_PATH
 UPLOAD_FOLDER = "uploads"
 PDF_FOLDER = "pdfs"
 RECOMMENDATION_FOLDER = "recommendations"
@@ -240,16 +283,205 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PDF_FOLDER, exist_ok=True)
 os.makedirs(RECOMMENDATION_FOLDER, exist_ok=True)
 
-# Loading YOLOv5 model
-model = torch.hub.load("ultralytics/yolov5", "custom", path=MODEL_PATH)
+# Per-request YOLOv5 save dirs (runs/detect/<key>)
+RUNS_FOLDER = os.path.join("runs", "detect")
+
+# Background sweeper bounding uploads/, pdfs/, recommendations/ and runs/detect
+retention = None
+if Config.RETENTION_ENABLED:
+    retention = RetentionManager(
+        [RetentionPolicy(os.path.normpath(folder), **limits) for folder, limits in Config.RETENTION_POLICIES.items()],
+        interval=Config.RETENTION_INTERVAL,
+        min_age=Config.RETENTION_MIN_AGE,
+        metrics=metrics,
+        managed=is_artifact
+    )
+
+# Per-request / content-keyed artifact names with atomic writes, so concurrent
+# requests for the same file name or patient never overwrite each other
+artifacts = ArtifactStore(
+    {"uploads": UPLOAD_FOLDER, "pdfs": PDF_FOLDER, "recommendations": RECOMMENDATION_FOLDER, "runs": RUNS_FOLDER},
+    retention=retention
+)
+
+# YOLOv5 model versions, starting with the local MODEL_PATH checkpoint (or
+# the version the registry state names, unless MODEL_PATH / MODEL_VERSION
+# are set explicitly); create_app() decides whether the active one loads in
+# the background or before the server forks
+model_registry = ModelRegistry(
+    loader_options={
+        "repo_dir": Config.YOLOV5_DIR,
+        "warmup_runs": Config.MODEL_WARMUP_RUNS,
+        "warmup_size": Config.INFER_SIZE,
+        "backend": Config.INFERENCE_BACKEND,
+        "num_threads": Config.INFERENCE_THREADS,
+    },
+    max_loaded=Config.MODEL_MAX_LOADED,
+    state_path=Config.MODEL_REGISTRY_STATE or None
+)
+model_registry.sync(force=True)
+if Config.MODEL_PINNED:
+    model_registry.pin(Config.MODEL_VERSION, MODEL_PATH)
+elif Config.MODEL_VERSION not in model_registry:
+    model_registry.add(Config.MODEL_VERSION, MODEL_PATH)
+
+# Upload decoding per inference size (JPEG DCT scaling, optional letterbox)
+INFER_SIZE = check_infer_size(Config.INFER_SIZE)
+preprocessors = {
+    size: Preprocessor(size, draft=Config.PREPROCESS_DRAFT, letterbox=Config.PREPROCESS_LETTERBOX)
+    for size in INFER_SIZES
+}
+
+# Per-process services, created by start_services(): the optional
+# asynchronous job pool and the optional micro-batching scheduler
+job_manager = None
+batcher = None
+services_pid = None
+
+# Optional cache of detection results keyed by image hash
+detection_cache = None
+if Config.DETECTION_CACHE:
+    detection_cache = DetectionCache(
+        max_entries=Config.DETECTION_CACHE_MAX_ENTRIES,
+        max_bytes=int(Config.DETECTION_CACHE_MAX_MB * 1024 * 1024),
+        disk_dir=Config.DETECTION_CACHE_DIR or None,
+        disk_max_entries=Config.DETECTION_CACHE_DISK_MAX_ENTRIES,
+        disk_max_bytes=int(Config.DETECTION_CACHE_DISK_MAX_MB * 1024 * 1024)
+    )
+
+def start_services():
+    """
+    Start the background machinery of this process: the MongoDB client, the
+    job pool, the micro-batcher and the retention sweeper. Threads and
+    MongoClients do not survive fork(), so a pre-forking server calls this
+    in every worker; repeated calls in the same process do nothing.
+    """
+    global job_manager, batcher, services_pid
+    if services_pid == os.getpid():
+        return
+    services_pid = os.getpid()
+
+    mongo.init_app(app, **mongo_client_options(Config))
+    # A store bound elsewhere (e.g. the benchmarks' mongomock one) is kept
+    if specialists.collection is None:
+        specialists.bind(mongo.db)
+    # Unique email / medicalId indexes, which login's lookups also use;
+    # built in the background so an unreachable MongoDB does not delay startup
+    threading.Thread(target=specialists.indexed, name="specialists-indexes", daemon=True).start()
+
+    # Job workers are forked here, so from the dev server they start before
+    # the parent imports torch; each loads its own copy of the model
+    if Config.JOB_WORKERS > 0:
+        job_manager = JobManager(
+            MODEL_PATH,
+            Config.YOLOV5_DIR,
+            backend=Config.INFERENCE_BACKEND,
+            num_threads=Config.INFERENCE_THREADS or 1,
+            workers=Config.JOB_WORKERS,
+            max_pending=Config.JOB_MAX_PENDING,
+            result_ttl=Config.JOB_RESULT_TTL,
+            max_loaded=Config.MODEL_MAX_LOADED,
+            # PDFs written by the workers join the retention index
+            on_result=lambda result: artifacts.register("pdfs", result["pdf_path"])
+        )
+    if Config.BATCH_INFERENCE:
+        batcher = MicroBatcher(
+            model_registry, max_batch_size=Config.BATCH_MAX_SIZE, max_wait_ms=Config.BATCH_MAX_WAIT_MS, size=INFER_SIZE
+        )
+    if retention is not None:
+        retention.start()
+
+
+@app.before_request
+def ensure_services():
+    # Covers servers that fork without calling start_services() themselves
+    start_services()
+    # Versions added or activated by another worker
+    model_registry.sync()
+
+
+def create_app(preload=False):
+    """
+    Application factory for wsgi.py and the development server
+
+    Args:
+        preload (bool): Load the weights synchronously, without warm-up, and
+            leave start_services() to the forked workers, which then share
+            the model pages copy-on-write (see gunicorn.conf.py)
+    Returns:
+        Flask: The configured app
+    """
+    if preload:
+        model_registry.load(background=False, warmup=False)
+        return app
+
+    start_services()
+    model_registry.load(background=Config.MODEL_LOAD_BACKGROUND)
+    return app
 
-def get_latest_results_dir():
-    """Find the latest runs/detect/expX directory."""
-    runs_dir = Path("runs/detect")
-    if not runs_dir.exists():
+
+def infer(image, version=None, size=None):
+    """
+    Run one image through the micro-batcher when enabled, otherwise directly;
+    a request for another size than the default always runs directly
+    """
+    version = model_registry.resolve(version)
+    size = size or INFER_SIZE
+    # The model object itself is passed on, so a swap while the image waits
+    # in the batcher queue cannot move it to another version
+    model = model_registry.get(version)
+    started = time.perf_counter()
+    if batcher is not None and size == INFER_SIZE:
+        results = batcher.infer(image, model)
+    else:
+        results = run_detection(model, image, size=size)
+    metrics.record_inference(results, model=version, seconds=time.perf_counter() - started)
+    return results
+
+def requested_model():
+    """Model version named by ?model=, or None for the active one."""
+    return request.args.get('model') or None
+
+def requested_size():
+    """Inference size named by ?size= (e.g. 320 for low-end devices), else INFER_SIZE."""
+    return check_infer_size(request.args.get('size') or INFER_SIZE)
+
+def model_unavailable(version):
+    """Error response when a version is unknown or still loading, otherwise None."""
+    try:
+        if model_registry.ready(version):
+            return None
+    except UnknownModel as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"error": "Model is still loading, please retry shortly"}), 503
+
+def wants_pdf_stream():
+    """Whether this request asked for the PDF itself rather than a link to it."""
+    return request.args.get('stream', str(Config.PDF_STREAM)).lower() == 'true'
+
+def pdf_archive(kind, path):
+    """Writer for the archived copy of a streamed PDF, or None when PDF_ARCHIVE is off."""
+    if not Config.PDF_ARCHIVE:
+        return None
+    return lambda data: artifacts.write(kind, path, data)
+
+def detection_cache_key(data, version=None, size=None):
+    """Cache key for upload bytes under a model version and size, or None when caching is off."""
+    if detection_cache is None:
         return None
-    exp_dirs = sorted(runs_dir.glob("exp*"), key=os.path.getmtime, reverse=True)
-    return exp_dirs[0] if exp_dirs else None
+    model = model_registry.get(version)
+    return DetectionCache.make_key(
+        data, model_registry.identity(version), size=size or INFER_SIZE,
+        draft=Config.PREPROCESS_DRAFT, letterbox=Config.PREPROCESS_LETTERBOX,
+        conf=getattr(model, 'conf', None), iou=getattr(model, 'iou', None)
+    )
+
+def detection_etag(data, filename, patient_name, specialist_review, version, size):
+    """ETag of a streamed detection report, from everything that goes into it."""
+    return content_key(
+        hashlib.sha256(data).hexdigest(), filename, patient_name, specialist_review,
+        model_registry.identity(version), size, Config.DETECT_IN_MEMORY, Config.PREPROCESS_DRAFT, Config.PREPROCESS_LETTERBOX
+    )
 
 def calculate_myopia_risk(axial_length, refraction, visual_acuity):
     """
@@ -266,96 +498,103 @@ def calculate_myopia_risk(axial_length, refraction, visual_acuity):
     risk_parameters = {
         "axial_length_risk": {
             "value": axial_length,
-            "risk_category": "High" if axial_length > 26 else "Moderate" if axial_length > 24.5 else "Low"
+            "risk_category": risk_category(axial_length, AXIAL_LENGTH_THRESHOLDS)
         },
         "refraction_risk": {
             "value": refraction,
-            "risk_category": "High" if abs(refraction) > 6 else "Moderate" if abs(refraction) > 3 else "Low"
+            "risk_category": risk_category(abs(refraction), REFRACTION_THRESHOLDS)
         },
         "visual_acuity_risk": {
             "value": visual_acuity,
-            "risk_category": "High" if visual_acuity < 0.5 else "Moderate" if visual_acuity < 0.8 else "Low"
+            "risk_category": risk_category(visual_acuity, VISUAL_ACUITY_THRESHOLDS, below=True)
         }
     }
 
     # Determine overall risk
-    risk_scores = {
-        "Low": 1,
-        "Moderate": 2,
-        "High": 3
-    }
+    risk_scores = RISK_SCORES
 
     risk_levels = [param['risk_category'] for param in risk_parameters.values()]
     avg_risk_score = sum(risk_scores[level] for level in risk_levels) / len(risk_levels)
 
-    overall_risk_summary = (
-        "High Risk Myopia Progression" if avg_risk_score > 2.3 else 
-        "Moderate Myopia Risk" if avg_risk_score > 1.7 else 
-        "Low Myopia Risk"
-    )
+    overall_risk_summary = risk_summary(avg_risk_score)
 
     # Generate treatment recommendations
-    primary_recommendations = []
-    secondary_recommendations = []
-
-    if overall_risk_summary == "High Risk Myopia Progression":
-        primary_recommendations = [
-            "Immediate Orthokeratology (Ortho-K) Lens Treatment",
-            "Atropine Low-Dose Therapy (0.01%)",
-            "Frequent Myopia Progression Monitoring (Every 3 months)"
-        ]
-        secondary_recommendations = [
-            "Multifocal Contact Lens Consideration",
-            "Outdoor Activity Increase (Minimum 2 hours/day)",
-            "Screen Time Reduction Strategy"
-        ]
-    elif overall_risk_summary == "Moderate Myopia Risk":
-        primary_recommendations = [
-            "Multifocal Soft Contact Lens Evaluation",
-            "Quarterly Eye Examinations",
-            "Blue Light Filtering Lens Options"
-        ]
-        secondary_recommendations = [
-            "Active Lifestyle Promotion",
-            "Digital Eye Strain Prevention",
-            "Potential Ortho-K Consultation"
-        ]
-    else:
-        primary_recommendations = [
-            "Annual Comprehensive Eye Examination",
-            "Standard Corrective Lens Prescription",
-            "Lifestyle Guidance for Eye Health"
-        ]
-        secondary_recommendations = [
-            "Vision Therapy Consultation",
-            "Nutrition Advice for Eye Health",
-            "Digital Screen Ergonomics"
-        ]
-
-    # Visualization of Risk Parameters
-    plt.figure(figsize=(10, 6))
-    categories = list(risk_parameters.keys())
-    values = [risk_scores[param['risk_category']] for param in risk_parameters.values()]
-    
-    plt.bar(categories, values, color=['green' if v==1 else 'yellow' if v==2 else 'red' for v in values])
-    plt.title('Myopia Risk Assessment')
-    plt.ylabel('Risk Level')
-    plt.ylim(0, 3)
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    
-    risk_chart_path = os.path.join(RECOMMENDATION_FOLDER, f"risk_chart_{hash(str(axial_length))}.png")
-    plt.savefig(risk_chart_path)
-    plt.close()
+    primary_recommendations = list(RECOMMENDATIONS[overall_risk_summary]["primary"])
+    secondary_recommendations = list(RECOMMENDATIONS[overall_risk_summary]["secondary"])
+
+    # Visualization of Risk Parameters: only the chart URL is returned here,
+    # the PNG is drawn lazily (and cached) when the frontend or a PDF asks for it
+    chart_path = risk_chart_path(risk_parameters)
 
     return {
         "overall_risk_summary": overall_risk_summary,
         "risk_parameters": risk_parameters,
         "primary_recommendations": primary_recommendations,
         "secondary_recommendations": secondary_recommendations,
-        "risk_chart_path": risk_chart_path
+        "risk_chart_path": chart_path
     }
 
+def detect_in_memory(file, patient_name, specialist_review, pdf_path, version, size):
+    """
+    Run detection straight from the upload bytes
+
+    Skips the uploads/ write, the runs/detect/expX directory and the exp-dir
+    scan; the annotated image goes from memory into the PDF and the response.
+    """
+    try:
+        data = file.read()
+
+        # A client that already holds this report gets a 304 before any work
+        etag = None
+        if wants_pdf_stream():
+            etag = detection_etag(data, file.filename, patient_name, specialist_review, version, size)
+            cached = not_modified(etag)
+            if cached:
+                return cached
+
+        # Cache hits skip decoding and the model entirely
+        with metrics.span("detect", "cache_lookup"):
+            cache_key = detection_cache_key(data, version, size)
+            entry = detection_cache.get(cache_key) if cache_key else None
+
+        if entry is None:
+            with metrics.span("detect", "decode"):
+                prepared = preprocessors[size](data)
+            with metrics.span("detect", "inference"):
+                results = infer(prepared.image, version, size)
+            with metrics.span("detect", "render"):
+                # Boxes in original pixels, overlay at the decoded resolution
+                entry = {
+                    "detections": prepared.to_original(detections_to_list(results)),
+                    "overlay": render_overlay(results, region=prepared.region),
+                }
+            if cache_key:
+                detection_cache.put(cache_key, entry)
+        overlay = entry["overlay"]
+
+        # Generating PDF report from the in-memory overlay
+        with metrics.span("detect", "pdf"):
+            pdf = build_detection_pdf(patient_name, file.filename, specialist_review, io.BytesIO(overlay))
+            if wants_pdf_stream():
+                return pdf_response(
+                    bytes(pdf.output()),
+                    os.path.basename(pdf_path),
+                    archive=pdf_archive("pdfs", pdf_path),
+                    headers={"X-Detections": json.dumps(entry["detections"]), "X-Model-Version": version},
+                    etag=etag
+                )
+            artifacts.write("pdfs", pdf_path, pdf.output())
+
+        return jsonify({
+            "image_url": jpeg_data_uri(overlay),
+            "pdf_url": f"http://127.0.0.1:5000/{pdf_path}",
+            "detections": entry["detections"],
+            "model": version,
+            "size": size,
+        })
+    except Exception as e:
+        return jsonify({"error": f"Error during processing: {str(e)}"}), 500
+
 @app.route("/detect", methods=["POST"])
 def detect():
     if "file" not in request.files:
@@ -365,53 +604,466 @@ def detect():
     patient_name = request.form.get("patient_name", "Unknown Patient")
     specialist_review = request.form.get("specialist_review", "No review provided")
     
-    input_path = os.path.join(UPLOAD_FOLDER, file.filename)
-    pdf_path = os.path.join(PDF_FOLDER, f"{Path(file.filename).stem}.pdf")
+    # Unique per request, so two uploads of V0001.jpg never share a path
+    key = request_key()
+    pdf_path = artifacts.path("pdfs", f"{Path(file.filename).stem}.pdf", key)
+
+    # ?model=<version> compares another registered version against the active one
+    unavailable = model_unavailable(requested_model())
+    if unavailable:
+        return unavailable
+    # Pinned for the whole request, even if the active version is swapped meanwhile
+    version = model_registry.resolve(requested_model())
+    try:
+        size = requested_size()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if Config.DETECT_IN_MEMORY:
+        return detect_in_memory(file, patient_name, specialist_review, pdf_path, version, size)
+
+    input_path = artifacts.path("uploads", file.filename, key)
     
+    data = file.read()
+    etag = None
+    if wants_pdf_stream():
+        etag = detection_etag(data, file.filename, patient_name, specialist_review, version, size)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+
     # Saving the uploaded file
-    file.save(input_path)
+    with metrics.span("detect", "save"):
+        artifacts.write("uploads", input_path, data)
     
     try:
+        # Decoding near the inference size instead of letting YOLOv5 decode the full JPEG
+        image = input_path
+        if Config.PREPROCESS_DRAFT:
+            with metrics.span("detect", "decode"):
+                image = np.array(open_reduced(data, size)[0])
+
         # Performing detection
-        results = model(input_path)
-        results.save()  # Default save location is runs/detect/expX
+        with metrics.span("detect", "inference"):
+            results = infer(image, version, size)
         
-        # Locating the latest results directory
-        latest_results_dir = get_latest_results_dir()
-        if not latest_results_dir:
-            return jsonify({"error": "No detection results found!"}), 500
+        # This request's own runs/detect/<key> instead of the next expX, which
+        # a concurrent request could pick up as "latest"
+        results_dir = Path(artifacts.directory("runs", key))
+        with metrics.span("detect", "results_save"):
+            results.save(save_dir=results_dir, exist_ok=True)
+        artifacts.register("runs", results_dir)
         
-        # Finding the processed image in the latest directory
-        processed_files = list(latest_results_dir.glob("*.jpg"))
-        if not processed_files:
-            return jsonify({"error": "No processed images found in results!"}), 500
+        # Finding the processed image in the results directory
+        with metrics.span("detect", "exp_dir_lookup"):
+            processed_files = list(results_dir.glob("*.jpg"))
+            if not processed_files:
+                return jsonify({"error": "No processed images found in results!"}), 500
         
         saved_image_path = processed_files[0]  # Use the first processed image
         
         # Generating PDF report
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        pdf.cell(200, 10, txt="Pathological Myopia Detection Results", ln=True, align='C')
-        pdf.ln(10)
-        pdf.cell(200, 10, txt=f"Patient: {patient_name}", ln=True)
-        pdf.cell(200, 10, txt=f"File: {file.filename}", ln=True)
-        pdf.ln(10)
-        pdf.cell(200, 10, txt="Specialist Review:", ln=True)
-        pdf.multi_cell(0, 10, txt=specialist_review)
-        pdf.ln(10)
-        pdf.cell(200, 10, txt="See result image below:", ln=True)
-        pdf.image(str(saved_image_path), x=10, y=pdf.get_y() + 10, w=100)
-        pdf.output(pdf_path)
+        with metrics.span("detect", "pdf"):
+            pdf = build_detection_pdf(patient_name, file.filename, specialist_review, str(saved_image_path))
+            if wants_pdf_stream():
+                return pdf_response(
+                    bytes(pdf.output()),
+                    os.path.basename(pdf_path),
+                    archive=pdf_archive("pdfs", pdf_path),
+                    headers={"X-Image-Url": f"http://127.0.0.1:5000/{saved_image_path}", "X-Model-Version": version},
+                    etag=etag
+                )
+            artifacts.write("pdfs", pdf_path, pdf.output())
         
         
         return jsonify({
             "image_url": f"http://127.0.0.1:5000/{saved_image_path}",
             "pdf_url": f"http://127.0.0.1:5000/{pdf_path}",
+            "model": version,
+            "size": size,
         })
     except Exception as e:
         return jsonify({"error": f"Error during processing: {str(e)}"}), 500
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds the {Config.MAX_UPLOAD_MB:g} MB limit"}), 413
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+
+def spool_uploads(files):
+    """
+    Copy uploads into spooled temp files owned by the caller
+
+    Werkzeug closes request files once the view returns, before a streamed
+    response body has been consumed.
+    """
+    spooled = []
+    for file in files:
+        buffer = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        shutil.copyfileobj(file.stream, buffer)
+        buffer.seek(0)
+        spooled.append((file.filename, buffer))
+    return spooled
+
+def iter_uploaded_images(uploads, max_image_bytes=None):
+    """
+    Yield (filename, bytes, error) for every spooled upload, expanding ZIP archives lazily
+
+    ZIP members larger than max_image_bytes uncompressed are never read; they
+    come back with bytes None and an error instead. zipfile stops reading a
+    member at its declared size, so a lying header cannot get past the check.
+    """
+    for filename, buffer in uploads:
+        with buffer:
+            if Path(filename).suffix.lower() == ".zip":
+                with zipfile.ZipFile(buffer) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or Path(info.filename).suffix.lower() not in IMAGE_EXTENSIONS:
+                            continue
+                        name = Path(info.filename).name
+                        if max_image_bytes and info.file_size > max_image_bytes:
+                            yield name, None, f"Image exceeds the {max_image_bytes / (1024 * 1024):g} MB limit"
+                            continue
+                        # A damaged, encrypted or oddly compressed member only costs its own line
+                        try:
+                            data = archive.read(info)
+                        except (zipfile.BadZipFile, RuntimeError, NotImplementedError, zlib.error) as e:
+                            yield name, None, f"Could not extract image: {str(e)}"
+                        else:
+                            yield name, data, None
+            else:
+                yield filename, buffer.read(), None
+
+def check_archives(uploads):
+    """Error message for the first .zip upload that is not a readable archive, or None."""
+    for filename, buffer in uploads:
+        if Path(filename).suffix.lower() != ".zip":
+            continue
+        try:
+            if not zipfile.is_zipfile(buffer):
+                return f"{filename} is not a ZIP archive"
+            buffer.seek(0)
+            zipfile.ZipFile(buffer).close()
+        except zipfile.BadZipFile as e:
+            return f"{filename} is not a valid ZIP archive: {str(e)}"
+        finally:
+            buffer.seek(0)
+    return None
+
+def detect_chunk(chunk, version=None, size=None):
+    """
+    Detect a chunk of (filename, bytes) uploads with one batched forward pass
+
+    Returns:
+        list: (filename, entry, error) per image, entry shaped like a detection cache entry
+    """
+    size = size or INFER_SIZE
+    outputs = [None] * len(chunk)
+    pending = []
+    for index, (filename, data) in enumerate(chunk):
+        cache_key = detection_cache_key(data, version, size)
+        entry = detection_cache.get(cache_key) if cache_key else None
+        if entry is not None:
+            outputs[index] = (filename, entry, None)
+            continue
+        try:
+            # The whole chunk is alive at once, so no shared letterbox buffer
+            pending.append((index, cache_key, preprocessors[size](data, reuse=False)))
+        except Exception as e:
+            outputs[index] = (filename, None, f"Could not decode image: {str(e)}")
+
+    if pending:
+        with metrics.span("detect_batch", "inference"):
+            started = time.perf_counter()
+            results = run_detection(model_registry.get(version), [prepared.image for _, _, prepared in pending], size=size)
+        metrics.record_inference(results, model=model_registry.resolve(version), seconds=time.perf_counter() - started)
+        for (index, cache_key, prepared), detections in zip(pending, results.tolist()):
+            entry = {
+                "detections": prepared.to_original(detections_to_list(detections)),
+                "overlay": render_overlay(detections, region=prepared.region),
+            }
+            if cache_key:
+                detection_cache.put(cache_key, entry)
+            outputs[index] = (chunk[index][0], entry, None)
+    return outputs
+
+@app.route("/detect/batch", methods=["POST"])
+def detect_batch():
+    """
+    Bulk screening: many images (multipart "files" or a ZIP archive) in one request
+
+    Streams one NDJSON line per image as soon as its batch finishes, followed
+    by a summary line with throughput and, when combined_pdf=true, the
+    combined report.
+    """
+    files = request.files.getlist("files") + request.files.getlist("file")
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+    unavailable = model_unavailable(requested_model())
+    if unavailable:
+        return unavailable
+    version = model_registry.resolve(requested_model())
+    try:
+        size = requested_size()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    batch_name = request.form.get("batch_name", "Screening batch")
+    combined_pdf = request.form.get("combined_pdf", "false").lower() == "true"
+    include_images = request.form.get("include_images", "false").lower() == "true"
+    uploads = spool_uploads(files)
+    # Checked before the 200 starts streaming, while a plain 400 is still possible
+    invalid = check_archives(uploads)
+    if invalid:
+        for _, buffer in uploads:
+            buffer.close()
+        return jsonify({"error": invalid}), 400
+
+    def generate():
+        started = time.perf_counter()
+        processed = 0
+        failed = 0
+        report_entries = []
+
+        images = iter_uploaded_images(uploads, int(Config.MAX_IMAGE_MB * 1024 * 1024))
+        while True:
+            taken = list(islice(images, Config.BATCH_MAX_SIZE))
+            if not taken:
+                break
+            chunk = []
+            for filename, data, error in taken:
+                if error:
+                    # Rejected before reading, e.g. an oversized ZIP member
+                    failed += 1
+                    yield json.dumps({"filename": filename, "error": error}) + "\n"
+                else:
+                    chunk.append((filename, data))
+            if not chunk:
+                continue
+            try:
+                outputs = detect_chunk(chunk, version, size)
+            except Exception as e:
+                outputs = [(filename, None, f"Error during processing: {str(e)}") for filename, _ in chunk]
+
+            for filename, entry, error in outputs:
+                if error:
+                    failed += 1
+                    yield json.dumps({"filename": filename, "error": error}) + "\n"
+                    continue
+                processed += 1
+                line = {"filename": filename, "detections": entry["detections"]}
+                if include_images:
+                    line["image_url"] = jpeg_data_uri(entry["overlay"])
+                if combined_pdf:
+                    report_entries.append((filename, entry["detections"], entry["overlay"]))
+                yield json.dumps(line) + "\n"
+
+        summary = {"images": processed, "failed": failed, "model": version, "size": size}
+        if report_entries:
+            pdf_path = artifacts.path("pdfs", "batch.pdf", request_key())
+            artifacts.write("pdfs", pdf_path, build_batch_pdf(batch_name, report_entries).output())
+            summary["pdf_url"] = f"http://127.0.0.1:5000/{pdf_path}"
+
+        elapsed = time.perf_counter() - started
+        summary["seconds"] = round(elapsed, 3)
+        summary["images_per_second"] = round(processed / elapsed, 2) if elapsed > 0 else 0.0
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+@app.route("/jobs/detect", methods=["POST"])
+def submit_detect_job():
+    """
+    Queue a detection + report job and return its id immediately
+    """
+    if job_manager is None:
+        return jsonify({"error": "Job mode is disabled (set JOB_WORKERS)"}), 404
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files["file"]
+    patient_name = request.form.get("patient_name", "Unknown Patient")
+    specialist_review = request.form.get("specialist_review", "No review provided")
+    pdf_path = artifacts.path("pdfs", f"{Path(file.filename).stem}.pdf", request_key())
+    try:
+        size = requested_size()
+        # Workers load the checkpoint of the active (or ?model=) version themselves
+        version = model_registry.resolve(requested_model())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except UnknownModel as e:
+        return jsonify({"error": str(e)}), 404
+    weights_path = model_registry.loader(version, touch=False).checkpoint_path
+
+    try:
+        job_id = job_manager.submit(
+            run_detection_job, file.read(), file.filename, patient_name, specialist_review, pdf_path,
+            weights_path, size, Config.PREPROCESS_DRAFT
+        )
+    except QueueFull as e:
+        response = jsonify({"error": f"Too many pending jobs, please retry later ({str(e)})"})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+    except WorkersUnavailable as e:
+        return jsonify({"error": f"Job workers are unavailable: {str(e)}"}), 503
+
+    return jsonify({
+        "job_id": job_id,
+        "model": version,
+        "status_url": f"http://127.0.0.1:5000/jobs/{job_id}"
+    }), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """
+    Poll a job; ?wait=<seconds> long-polls until it finishes or the wait runs out
+    """
+    if job_manager is None:
+        return jsonify({"error": "Job mode is disabled (set JOB_WORKERS)"}), 404
+
+    try:
+        timeout = min(float(request.args.get("wait", 0)), Config.JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    status = job_manager.status(job_id, timeout)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    if status["status"] == "done":
+        result = status.pop("result")
+        status["result"] = {
+            "image_url": jpeg_data_uri(result["overlay"]),
+            "pdf_url": f"http://127.0.0.1:5000/{result['pdf_path']}",
+            "detections": result["detections"],
+        }
+    return jsonify(status)
+
+def bearer_claims():
+    """Verified JWT claims of the Authorization header, or None."""
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        token = token[7:]
+    if not token:
+        return None
+    try:
+        return token_verifier.verify(token)
+    except jwt.InvalidTokenError:
+        return None
+
+@app.route("/models", methods=["GET"])
+def list_models():
+    """
+    Registered model versions, which one is active and which are loaded
+    """
+    return jsonify(model_registry.status())
+
+@app.route("/models", methods=["POST"])
+def add_model():
+    """
+    Register a training run (MODEL_RUNS_DIR/<name>/weights/best.pt) and load it
+    in the background; with "activate": true it replaces the active version
+    once warmed up
+    """
+    if bearer_claims() is None:
+        return jsonify({'message': 'Token is missing or invalid'}), 401
+
+    data = request.json or {}
+    name = data.get("name", "")
+    if not name or secure_filename(name) != name:
+        return jsonify({"error": "A plain training run name is required, e.g. exp27"}), 400
+    if name in model_registry:
+        return jsonify({"error": f"Model version '{name}' is already registered"}), 409
+
+    weights_path = os.path.join(Config.MODEL_RUNS_DIR, name, "weights", "best.pt")
+    if not os.path.exists(weights_path):
+        return jsonify({"error": f"No weights found at {weights_path}"}), 404
+
+    model_registry.add(name, weights_path, activate=bool(data.get("activate")))
+    return jsonify(model_registry.status()), 202
+
+@app.route("/models/<name>/activate", methods=["POST"])
+def activate_model(name):
+    """
+    Switch the active version; in-flight requests finish on the previous one
+    """
+    if bearer_claims() is None:
+        return jsonify({'message': 'Token is missing or invalid'}), 401
+    try:
+        swapped = model_registry.activate(name)
+    except UnknownModel as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(model_registry.status()), 200 if swapped else 202
+
+@app.route("/models/<name>", methods=["DELETE"])
+def remove_model(name):
+    """
+    Unregister an inactive version and free its weights
+    """
+    if bearer_claims() is None:
+        return jsonify({'message': 'Token is missing or invalid'}), 401
+    try:
+        model_registry.remove(name)
+    except UnknownModel as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(model_registry.status())
+
+@app.route("/inference/stats", methods=["GET"])
+def inference_stats():
+    """
+    Queue depth, batch-size histogram and stage timings of the micro-batcher
+    """
+    if batcher is None:
+        return jsonify({"batching": False})
+    return jsonify({"batching": True, **batcher.stats()})
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """
+    Hit/miss counters and occupancy of the detection result cache
+    """
+    if detection_cache is None:
+        return jsonify({"cache": False})
+    return jsonify({"cache": True, **detection_cache.stats()})
+
+@app.route("/auth/hash-stats", methods=["GET"])
+def hash_stats():
+    """
+    Queue depth, rehash count and hashing latencies of the password hasher
+    """
+    return jsonify(password_hasher.stats())
+
+@app.route("/auth/cache-stats", methods=["GET"])
+def auth_cache_stats():
+    """
+    Hit ratios of the verified-token and user-profile caches
+    """
+    return jsonify({
+        "tokens": token_verifier.claims_cache.stats(),
+        "profiles": profile_cache.stats(),
+    })
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Request and stage latency histograms plus model counters, Prometheus text format
+    """
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled (set METRICS_ENABLED)"}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/retention/stats", methods=["GET"])
+def retention_stats():
+    """
+    Live entries, bytes and reclaimed totals per artifact folder
+    """
+    if retention is None:
+        return jsonify({"retention": False})
+    return jsonify({"retention": True, **retention.stats()})
+
 @app.route("/recommend", methods=["POST"])
 def generate_recommendation():
     """
@@ -427,14 +1079,65 @@ def generate_recommendation():
         if not all([axial_length, refraction is not None, visual_acuity is not None]):
             return jsonify({"error": "Missing required clinical measurements"}), 400
 
-        # Generate recommendation
-        recommendation = calculate_myopia_risk(axial_length, refraction, visual_acuity)
+        # Generate recommendation (the chart itself is timed in serve_risk_chart)
+        with metrics.span("recommend", "risk"):
+            recommendation = calculate_myopia_risk(axial_length, refraction, visual_acuity)
         
         return jsonify(recommendation)
 
     except Exception as e:
         return jsonify({"error": f"Error generating recommendation: {str(e)}"}), 500
 
+@app.route("/recommend/batch", methods=["POST"])
+def generate_recommendation_batch():
+    """
+    Population-level risk stratification for many patients in one call
+
+    Accepts {"patients": [{axial_length, refraction, visual_acuity}, ...]}
+    or columns {"axial_length": [...], "refraction": [...], "visual_acuity": [...]}.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Missing request body"}), 400
+
+        columns = ["axial_length", "refraction", "visual_acuity"]
+        try:
+            if "patients" in data:
+                frame = pd.DataFrame(data["patients"], columns=columns)
+            else:
+                frame = pd.DataFrame({column: data.get(column) for column in columns})
+            frame = frame.astype(float)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Clinical measurements must be numeric"}), 400
+
+        if frame.empty or frame[columns].isna().any().any():
+            return jsonify({"error": "Missing required clinical measurements"}), 400
+
+        results = calculate_myopia_risk_batch(frame)
+
+        return jsonify({
+            "count": len(results),
+            "results": results.to_dict(orient="records"),
+            "summary_counts": results["overall_risk_summary"].value_counts().to_dict(),
+            "recommendations": RECOMMENDATIONS
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Error generating recommendations: {str(e)}"}), 500
+
+@app.route("/risk-chart/<key>.png", methods=["GET"])
+def serve_risk_chart(key):
+    """
+    Serve the risk chart for a category combination, rendering it on first use
+    """
+    categories = parse_risk_chart_key(key)
+    if categories is None:
+        return jsonify({"error": "Unknown risk chart"}), 404
+    with metrics.span("recommend", "chart"):
+        png = render_risk_chart(categories)
+    return send_file(io.BytesIO(png), mimetype='image/png', max_age=86400)
+
 @app.route("/save-recommendation", methods=["POST"])
 def save_recommendation():
     try:
@@ -442,149 +1145,43 @@ def save_recommendation():
         patient_name = data.get('patient_name', 'Unknown Patient')
         recommendation = data.get('recommendation', {})
         
-        # Use the RecommendationPDF class that has Unicode support
-        pdf = RecommendationPDF(orientation='P', unit='mm', format='A4')
-        pdf.alias_nb_pages()
-        pdf.add_page()
-        
-        page_width = pdf.w - 2 * pdf.l_margin
-        
-        # Try to use DejaVu font that supports Unicode characters
-        try:
-            pdf.set_font('DejaVu', '', 12)
-        except:
-            pdf.set_font('Arial', '', 12)
-        
-        # Patient and Document Header
-        try:
-            pdf.set_font('DejaVu', 'B', 14)
-        except:
-            pdf.set_font('Arial', 'B', 14)
-        pdf.cell(page_width, 10, f"Myopia Treatment Recommendation for {patient_name}", 0, 1, 'C')
-        pdf.ln(5)
+        # Keyed by content: the same patient and recommendation always map to
+        # the same file, different ones never do
+        key = content_key(patient_name, recommendation)
+        pdf_path = artifacts.path("recommendations", f"{patient_name}_myopia_recommendation.pdf", key)
+        pdf_filename = os.path.basename(pdf_path)
+        if wants_pdf_stream():
+            cached = not_modified(key)
+            if cached:
+                return cached
+        elif os.path.exists(pdf_path):
+            return jsonify({
+                "message": "Recommendation saved successfully",
+                "filename": pdf_filename
+            })
         
-        # Overall Risk Summary
-        # Check if we need to add a page break before this section
-        if pdf.get_y() > 260:  # If less than 30mm available, add new page
-            pdf.add_page()
-            
-        try:
-            pdf.set_font('DejaVu', 'B', 12)
-        except:
-            pdf.set_font('Arial', 'B', 12)
-        pdf.cell(page_width, 10, "Overall Risk Summary", 0, 1)
-        
-        try:
-            pdf.set_font('DejaVu', '', 11)
-        except:
-            pdf.set_font('Arial', '', 11)
-        pdf.multi_cell(page_width, 10, recommendation.get('overall_risk_summary', 'No summary available'))
-        pdf.ln(5)
-        
-        # Risk Parameters
-        # Check if we need to add a page break before this section
-        if pdf.get_y() > 240:  # Need more space for risk parameters
-            pdf.add_page()
-            
-        try:
-            pdf.set_font('DejaVu', 'B', 12)
-        except:
-            pdf.set_font('Arial', 'B', 12)
-        pdf.cell(page_width, 10, "Risk Parameters", 0, 1)
-        
-        try:
-            pdf.set_font('DejaVu', '', 11)
-        except:
-            pdf.set_font('Arial', '', 11)
-            
-        risk_params = recommendation.get('risk_parameters', {})
-        for key, value in risk_params.items():
-            # Check if we need to add a page break
-            if pdf.get_y() > 270:
-                pdf.add_page()
-                
-            if isinstance(value, dict):
-                display_value = f"{value.get('value', 'N/A')} (Risk: {value.get('risk_category', 'N/A')})"
-            else:
-                display_value = str(value)
-            pdf.multi_cell(page_width, 10, f"{key.replace('_', ' ').title()}: {display_value}")
-        pdf.ln(5)
-        
-        # Primary Recommendations
-        # Check if we need to add a page break before this section
-        if pdf.get_y() > 240:  # Need more space for recommendations
-            pdf.add_page()
-            
-        try:
-            pdf.set_font('DejaVu', 'B', 12)
-        except:
-            pdf.set_font('Arial', 'B', 12)
-        pdf.cell(page_width, 10, "Primary Recommendations", 0, 1)
-        
-        try:
-            pdf.set_font('DejaVu', '', 11)
-        except:
-            pdf.set_font('Arial', '', 11)
-            
-        primary_recs = recommendation.get('primary_recommendations', [])
-        for rec in primary_recs:
-            # Check if we need to add a page break
-            if pdf.get_y() > 270:
-                pdf.add_page()
-                
-            pdf.multi_cell(page_width, 10, f"- {rec}")
-        pdf.ln(5)
-        
-        # Secondary Recommendations
-        # Check if we need to add a page break before this section
-        if pdf.get_y() > 240:  # Need more space for secondary recommendations
-            pdf.add_page()
-            
-        try:
-            pdf.set_font('DejaVu', 'B', 12)
-        except:
-            pdf.set_font('Arial', 'B', 12)
-        pdf.cell(page_width, 10, "Secondary Recommendations", 0, 1)
-        
-        try:
-            pdf.set_font('DejaVu', '', 11)
-        except:
-            pdf.set_font('Arial', '', 11)
-            
-        secondary_recs = recommendation.get('secondary_recommendations', [])
-        for rec in secondary_recs:
-            # Check if we need to add a page break
-            if pdf.get_y() > 270:
-                pdf.add_page()
-                
-            pdf.multi_cell(page_width, 10, f"- {rec}")
-        pdf.ln(5)
-        
-        # Risk Chart - Always start on a new page for the chart
+        chart_image = None
         if recommendation.get('risk_chart_path'):
             try:
-                pdf.add_page()
-                try:
-                    pdf.set_font('DejaVu', 'B', 12)
-                except:
-                    pdf.set_font('Arial', 'B', 12)
-                pdf.cell(page_width, 10, "Risk Assessment Visualization", 0, 1)
-                
-                # Center the chart and make sure it fits properly
-                chart_width = 160  # mm
-                chart_height = 100  # approximate height in mm
-                x_position = (page_width - chart_width) / 2 + pdf.l_margin
-                
-                pdf.image(recommendation['risk_chart_path'], x=x_position, y=pdf.get_y() + 5, w=chart_width)
+                with metrics.span("save_recommendation", "chart"):
+                    chart_image = risk_chart_image(recommendation['risk_chart_path'])
             except Exception as e:
                 print(f"Error adding risk chart to PDF: {e}")
-        
-        # Generate filename
-        pdf_filename = f"{patient_name}_myopia_recommendation.pdf"
-        pdf_path = os.path.join(RECOMMENDATION_FOLDER, pdf_filename)
-        
-        os.makedirs(RECOMMENDATION_FOLDER, exist_ok=True)
-        pdf.output(pdf_path)
+
+        # Shared page template, fonts parsed once per process
+        with metrics.span("save_recommendation", "layout"):
+            pdf = build_recommendation_pdf(patient_name, recommendation, chart_image)
+
+        with metrics.span("save_recommendation", "output"):
+            if wants_pdf_stream():
+                return pdf_response(
+                    bytes(pdf.output()),
+                    f"{patient_name}_myopia_recommendation.pdf",
+                    archive=pdf_archive("recommendations", pdf_path),
+                    etag=key
+                )
+            
+            artifacts.write("recommendations", pdf_path, pdf.output())
         
         return jsonify({
             "message": "Recommendation saved successfully",
@@ -628,6 +1225,8 @@ def serve_file(filename):
         return jsonify({"error": "File not found"}), 404
 
 if __name__ == '__main__':
-    # Import datetime here to avoid circular import
-    from datetime import datetime
+    # The debug reloader runs this module in a parent and a serving child;
+    # only the child (WERKZEUG_RUN_MAIN) loads the model
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,68 @@
+# artifacts.py
+import hashlib
+import json
+import os
+import re
+import uuid
+
+from werkzeug.utils import secure_filename
+
+from detection_cache import atomic_write
+
+
+# Names ArtifactStore generates: "<stem>_<key><ext>" files and "<key>" directories
+ARTIFACT_NAME = re.compile(r"^(?:.*_)?[0-9a-f]{16}(?:\.\w+)?$")
+
+
+def is_artifact(name):
+    """Whether a file or directory name was generated by ArtifactStore (not, e.g., a bundled sample)."""
+    return ARTIFACT_NAME.match(name) is not None
+
+
+def request_key():
+    """Unique key for artifacts that belong to one request."""
+    return uuid.uuid4().hex[:16]
+
+
+def content_key(*parts):
+    """Stable key derived from JSON-serializable content; equal inputs give equal keys."""
+    encoded = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ArtifactStore:
+    """
+    Collision-free names and atomic writes for generated files
+
+    Every artifact name carries a per-request or content-hash key next to a
+    sanitized version of the user-supplied name, so concurrent requests for
+    the same upload or patient never share a path, and readers never see a
+    half-written file. New artifacts are registered with the retention
+    manager when one is given.
+    """
+
+    def __init__(self, folders, retention=None):
+        self.folders = dict(folders)
+        self.retention = retention
+        for folder in self.folders.values():
+            os.makedirs(folder, exist_ok=True)
+
+    def path(self, kind, filename, key):
+        """e.g. path("pdfs", "V0001.pdf", key) -> "pdfs/V0001_<key>.pdf"."""
+        stem, ext = os.path.splitext(secure_filename(filename) or "artifact")
+        return os.path.join(self.folders[kind], f"{stem}_{key}{ext}")
+
+    def directory(self, kind, key):
+        """Per-request directory, e.g. a YOLOv5 save_dir under runs/detect."""
+        return os.path.join(self.folders[kind], key)
+
+    def write(self, kind, path, data):
+        """Atomically write bytes (or an fpdf bytearray) and register the file."""
+        atomic_write(path, bytes(data))
+        self.register(kind, path)
+        return path
+
+    def register(self, kind, path):
+        folder = os.path.normpath(self.folders[kind])
+        if self.retention is not None and folder in self.retention.policies:
+            self.retention.register(folder, path)
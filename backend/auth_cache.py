@@ -0,0 +1,97 @@
+# auth_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries also expire after a TTL
+
+    put() may pass an earlier expiry than the default TTL, e.g. a token's exp
+    claim, so an entry never outlives the thing it was derived from.
+    """
+
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, expires_at=None):
+        expiry = time.time() + self.ttl
+        if expires_at is not None:
+            expiry = min(expiry, expires_at)
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+class TokenVerifier:
+    """
+    HS256 token issuing and verification with a cache of verified claims
+
+    A token is only cached after a full signature check, and never past its
+    own exp claim, so a cache hit can be trusted exactly like a fresh decode.
+    """
+
+    def __init__(self, secret_key, expires_in=86400, cache_ttl=60, max_entries=1024):
+        self.secret_key = secret_key
+        self.expires_in = expires_in
+        self.claims_cache = TTLCache(cache_ttl, max_entries)
+
+    def issue(self, claims):
+        """Sign claims with iat and exp set from expires_in seconds."""
+        now = int(time.time())
+        return jwt.encode({**claims, "iat": now, "exp": now + self.expires_in}, self.secret_key, algorithm="HS256")
+
+    def verify(self, token):
+        """
+        Claims of a valid token
+
+        Raises:
+            jwt.ExpiredSignatureError, jwt.InvalidTokenError: As jwt.decode()
+        """
+        claims = self.claims_cache.get(token)
+        if claims is None:
+            claims = jwt.decode(token, self.secret_key, algorithms=["HS256"])
+            self.claims_cache.put(token, claims, expires_at=claims.get("exp"))
+        return claims
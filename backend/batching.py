@@ -0,0 +1,151 @@
+# batching.py
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Background scheduler that groups pending images into one forward pass
+
+    Requests are collected until either max_batch_size images are waiting or
+    max_wait_ms has passed since the oldest one arrived. The batch is run
+    through the YOLOv5 model once and every caller receives its own
+    single-image Detections slice. Callers may name the model per image
+    (e.g. one model registry version); a batch only ever holds images for
+    the same model.
+    """
+
+    STAGES = ("queue_wait", "inference", "split")
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=20, size=640):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.size = size
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._running = True
+
+        self.batch_sizes = Counter()
+        self.stage_timings = {stage: {"count": 0, "total": 0.0, "max": 0.0} for stage in self.STAGES}
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, image, model=None):
+        """Queue an image (array or path) and return a Future for its Detections; model defaults to self.model."""
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Micro-batcher has been stopped")
+            self._queue.append((image, future, time.perf_counter(), self.model if model is None else model))
+            self._cond.notify()
+        return future
+
+    def infer(self, image, model=None, timeout=None):
+        """Blocking helper: submit an image and wait for its Detections."""
+        return self.submit(image, model).result(timeout)
+
+    def stop(self):
+        """Stop the scheduler thread once the queue has drained."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """Queue depth, batch-size histogram and per-stage timings in milliseconds."""
+        with self._stats_lock:
+            stages = {}
+            for stage, timing in self.stage_timings.items():
+                count = timing["count"]
+                stages[stage] = {
+                    "count": count,
+                    "avg_ms": round(timing["total"] / count * 1000, 3) if count else 0.0,
+                    "max_ms": round(timing["max"] * 1000, 3),
+                }
+            histogram = {str(size): n for size, n in sorted(self.batch_sizes.items())}
+            batches = sum(self.batch_sizes.values())
+            images = sum(size * n for size, n in self.batch_sizes.items())
+
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": batches,
+            "images": images,
+            "batch_size_histogram": histogram,
+            "stages": stages,
+        }
+
+    def _record(self, stage, seconds):
+        timing = self.stage_timings[stage]
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+    def _collect(self):
+        """Wait for the next batch; returns an empty list once stopped and drained."""
+        with self._cond:
+            while not self._queue and self._running:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            # The window is measured from the oldest pending request, and the
+            # batch is filled with requests for the same model only
+            _, _, oldest, model = self._queue[0]
+            deadline = oldest + self.max_wait
+            while self._running and self._count(model) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, rest = [], deque()
+            for item in self._queue:
+                if item[3] is model and len(batch) < self.max_batch_size:
+                    batch.append(item)
+                else:
+                    rest.append(item)
+            self._queue = rest
+            return batch
+
+    def _count(self, model):
+        return sum(1 for item in self._queue if item[3] is model)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            images = [image for image, _, _, _ in batch]
+            try:
+                results = batch[0][3](images, size=self.size)
+                inferred = time.perf_counter()
+                slices = results.tolist()
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self.batch_sizes[len(batch)] += 1
+                for _, _, queued, _ in batch:
+                    self._record("queue_wait", started - queued)
+                self._record("inference", inferred - started)
+                self._record("split", finished - inferred)
+
+            for (_, future, _, _), detections in zip(batch, slices):
+                future.set_result(detections)
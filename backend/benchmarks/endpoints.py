@@ -0,0 +1,312 @@
+# benchmarks/endpoints.py
+"""
+Latency, throughput and peak memory of the detection, recommendation and
+auth endpoints, plus the detection and recommendation stages on their own.
+
+The app is driven through its Flask test client with the sample images in
+uploads/, a stub model (no torch needed) and a mongomock specialists store,
+from a temporary working directory so no PDFs land in the repo. mongomock
+is pinned in requirements.txt for that.
+
+Usage (from backend/):
+    python -m benchmarks.endpoints --requests 200 --output bench.json
+    python -m benchmarks.endpoints --compare bench.json
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+import warnings
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGES = os.path.join(BACKEND_DIR, "uploads", "*.jpg")
+
+SPECIALIST = {
+    "fullName": "Benchmark Specialist",
+    "email": "bench@example.com",
+    "medicalId": "BENCH-001",
+    "specialty": "Ophthalmology",
+    "password": "benchmark-password",
+}
+
+MEASUREMENTS = [
+    {"axial_length": 26.8, "refraction": -7.25, "visual_acuity": 0.4},
+    {"axial_length": 25.1, "refraction": -4.0, "visual_acuity": 0.7},
+    {"axial_length": 23.6, "refraction": -1.5, "visual_acuity": 1.0},
+]
+
+
+class StubTensor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def tolist(self):
+        return [list(row) for row in self.rows]
+
+
+class StubDetections:
+    """Enough of YOLOv5's Detections API for inference.py: xyxy, names and render()."""
+
+    names = {0: "normal", 1: "pathologic"}
+
+    def __init__(self, ims):
+        self.ims = ims
+        self.n = len(ims)
+        self.xyxy = []
+        for im in ims:
+            h, w = im.shape[:2]
+            self.xyxy.append(StubTensor([[w * 0.3, h * 0.3, w * 0.5, h * 0.5, 0.87, 1.0]]))
+
+    def render(self):
+        for im, boxes in zip(self.ims, self.xyxy):
+            for x1, y1, x2, y2, _, _ in boxes.rows:
+                im[int(y1):int(y1) + 3, int(x1):int(x2)] = (255, 0, 0)
+                im[int(y2) - 3:int(y2), int(x1):int(x2)] = (255, 0, 0)
+        return self.ims
+
+    def tolist(self):
+        return [StubDetections([im]) for im in self.ims]
+
+
+class StubModel:
+    """Stands in for the YOLOv5 AutoShape model, sleeping infer_ms per image."""
+
+    conf = 0.25
+    iou = 0.45
+
+    def __init__(self, infer_ms=0.0):
+        self.infer_ms = infer_ms
+
+    def __call__(self, ims, size=640):
+        if not isinstance(ims, list):
+            ims = [ims]
+        if self.infer_ms:
+            time.sleep(self.infer_ms * len(ims) / 1000.0)
+        return StubDetections([np.array(im) for im in ims])
+
+
+def summarize(latencies, elapsed):
+    """p50/p95/p99/mean latency in milliseconds and calls per second."""
+    ms = np.asarray(latencies) * 1000
+    return {
+        "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_per_s": round(len(ms) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def peak_memory_kb(fn, calls):
+    """Peak Python-tracked allocation (NumPy included) over a few calls, in KiB."""
+    tracemalloc.start()
+    try:
+        for i in range(calls):
+            fn(i)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def measure(fn, count, warmup, memory_calls):
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(count):
+        call_started = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - call_started)
+    result = summarize(latencies, time.perf_counter() - started)
+    result["peak_memory_kb"] = peak_memory_kb(fn, memory_calls)
+    return result
+
+
+def load_app(infer_ms):
+    """Import app.py with the stub model and a mongomock specialists store."""
+    import mongomock
+
+    # Defaults that keep the run self-contained; explicit env vars still win
+    os.environ.setdefault("MODEL_LOAD_BACKGROUND", "True")
+    os.environ.setdefault("DETECTION_CACHE", "False")
+    os.environ.setdefault("PDF_ARCHIVE", "False")
+    os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "100")
+
+    import app as app_module
+    from specialists import SpecialistStore
+
+    app_module.model_registry.loader().use(StubModel(infer_ms))
+    app_module.specialists = SpecialistStore(mongomock.MongoClient().myopiadx, profile_cache=app_module.profile_cache)
+    app_module.specialists.ensure_indexes()
+    return app_module
+
+
+def check(response, expected=200):
+    if response.status_code != expected:
+        raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def endpoint_cases(app_module, images):
+    client = app_module.app.test_client()
+
+    check(client.post("/api/auth/register", json=SPECIALIST), 201)
+    login = check(client.post("/api/auth/login", json={"email": SPECIALIST["email"], "password": SPECIALIST["password"]})).get_json()
+    auth_headers = {"Authorization": f"Bearer {login['token']}"}
+    recommendation = check(client.post("/recommend", json=MEASUREMENTS[0])).get_json()
+
+    def detect(query):
+        def call(i):
+            name, data = images[i % len(images)]
+            form = {"file": (io.BytesIO(data), name), "patient_name": f"Patient {i}"}
+            check(client.post(f"/detect{query}", data=form, content_type="multipart/form-data"))
+        return call
+
+    return {
+        "POST /detect": detect(""),
+        "POST /detect?stream=true": detect("?stream=true"),
+        "POST /detect?size=320": detect("?size=320"),
+        "POST /recommend": lambda i: check(client.post("/recommend", json=MEASUREMENTS[i % len(MEASUREMENTS)])),
+        # Unique names: an identical patient + recommendation reuses the saved PDF
+        "POST /save-recommendation": lambda i: check(client.post(
+            "/save-recommendation", json={"patient_name": f"Patient {uuid.uuid4().hex}", "recommendation": recommendation})),
+        "POST /api/auth/login": lambda i: check(client.post(
+            "/api/auth/login", json={"email": SPECIALIST["email"], "password": SPECIALIST["password"]})),
+        "GET /user/<id>": lambda i: check(client.get(f"/user/{login['userId']}", headers=auth_headers)),
+    }
+
+
+def stage_cases(app_module, images):
+    from charts import render_risk_chart, risk_chart_image
+    from inference import decode_image, detections_to_list, render_overlay, run_detection
+    from reports import build_detection_pdf, build_recommendation_pdf
+
+    model = app_module.model_registry.get()
+    decoded = [decode_image(data) for _, data in images]
+    overlays = [render_overlay(run_detection(model, image.copy())) for image in decoded]
+    recommendation = app_module.calculate_myopia_risk(**MEASUREMENTS[0])
+
+    def infer(i):
+        detections_to_list(run_detection(model, decoded[i % len(decoded)]))
+
+    def render(i):
+        render_overlay(run_detection(model, decoded[i % len(decoded)].copy()))
+
+    def detection_pdf(i):
+        name = images[i % len(images)][0]
+        bytes(build_detection_pdf(f"Patient {i}", name, "Benchmark review", io.BytesIO(overlays[i % len(overlays)])).output())
+
+    def chart(i):
+        # Bypass the lru_cache to measure the drawing itself
+        render_risk_chart.__wrapped__(("High", "Moderate", "Low"))
+
+    def recommendation_pdf(i):
+        chart_image = risk_chart_image(recommendation["risk_chart_path"])
+        bytes(build_recommendation_pdf(f"Patient {i}", recommendation, chart_image).output())
+
+    preprocessors = app_module.preprocessors
+
+    return {
+        "decode": lambda i: decode_image(images[i % len(images)][1]),
+        "preprocess": lambda i: preprocessors[app_module.INFER_SIZE](images[i % len(images)][1]),
+        "preprocess_320": lambda i: preprocessors[320](images[i % len(images)][1]),
+        "infer": infer,
+        "render": render,
+        "pdf": detection_pdf,
+        "risk": lambda i: app_module.calculate_myopia_risk(**MEASUREMENTS[i % len(MEASUREMENTS)]),
+        "chart": chart,
+        "recommendation_pdf": recommendation_pdf,
+    }
+
+
+def compare(current, previous):
+    """Print p50 / throughput changes against an earlier results file."""
+    for section in ("endpoints", "stages"):
+        for name, result in current[section].items():
+            before = previous.get(section, {}).get(name)
+            if not before:
+                continue
+            p50 = (result["p50_ms"] / before["p50_ms"] - 1) * 100 if before["p50_ms"] else 0.0
+            print(f"{name:32s} p50 {before['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} ms ({p50:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection and recommendation endpoints")
+    parser.add_argument("--requests", type=int, default=100, help="measured calls per endpoint and stage")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--memory-calls", type=int, default=5, help="calls traced for peak memory")
+    parser.add_argument("--infer-ms", type=float, default=0.0, help="simulated model latency per image")
+    parser.add_argument("--images", default=SAMPLE_IMAGES)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    images = []
+    for path in sorted(glob.glob(args.images)):
+        with open(path, "rb") as f:
+            images.append((os.path.basename(path), f.read()))
+    if not images:
+        parser.error(f"no images match {args.images}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    previous_path = os.path.abspath(args.compare) if args.compare else None
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="myopiadx-bench-"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        app_module = load_app(args.infer_ms)
+        cases = (("endpoints", endpoint_cases(app_module, images)), ("stages", stage_cases(app_module, images)))
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests,
+            "infer_ms": args.infer_ms,
+            "images": len(images),
+            "detect_in_memory": app_module.Config.DETECT_IN_MEMORY,
+            "detection_cache": app_module.Config.DETECTION_CACHE,
+            "password_hash_method": app_module.password_hasher.method,
+        },
+        "endpoints": {},
+        "stages": {},
+    }
+    for section, section_cases in cases:
+        for name, fn in section_cases.items():
+            # The routes print per request; keep that out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = measure(fn, args.requests, args.warmup, args.memory_calls)
+            results[section][name] = result
+            print(
+                f"{name:32s} p50 {result['p50_ms']:9.3f}  p95 {result['p95_ms']:9.3f}  p99 {result['p99_ms']:9.3f} ms  "
+                f"{result['throughput_per_s']:9.1f}/s  peak {result['peak_memory_kb']:9.1f} KiB"
+            )
+    results["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+    if previous_path:
+        with open(previous_path) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
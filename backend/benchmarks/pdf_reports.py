@@ -0,0 +1,82 @@
+# benchmarks/pdf_reports.py
+"""
+Recommendation PDFs per second, before and after the shared report engine.
+
+"before" parses the full DejaVu TTFs for every document and embeds the RGBA
+PNG chart, like the original save_recommendation(); "after" uses the cached
+font subsets and the cached JPEG chart.
+
+Usage (from backend/):
+    python -m benchmarks.pdf_reports --count 1000
+"""
+import argparse
+import io
+import time
+import warnings
+
+from charts import parse_risk_chart_key, render_risk_chart, risk_chart_image, risk_chart_path
+from reports import build_recommendation_pdf
+from risk import RECOMMENDATIONS, calculate_myopia_risk_batch
+
+SAMPLE_PATIENTS = [
+    (26.8, -7.25, 0.4),
+    (25.1, -4.0, 0.7),
+    (23.6, -1.5, 1.0),
+    (24.9, -6.5, 0.9),
+]
+
+
+def sample_recommendations():
+    """Recommendation dicts shaped like calculate_myopia_risk() output, without importing the app."""
+    axial_length, refraction, visual_acuity = zip(*SAMPLE_PATIENTS)
+    recommendations = []
+    for row in calculate_myopia_risk_batch(axial_length, refraction, visual_acuity).itertuples():
+        risk_parameters = {
+            "axial_length_risk": {"value": row.axial_length, "risk_category": row.axial_length_risk},
+            "refraction_risk": {"value": row.refraction, "risk_category": row.refraction_risk},
+            "visual_acuity_risk": {"value": row.visual_acuity, "risk_category": row.visual_acuity_risk},
+        }
+        recommendations.append({
+            "overall_risk_summary": row.overall_risk_summary,
+            "risk_parameters": risk_parameters,
+            "primary_recommendations": RECOMMENDATIONS[row.overall_risk_summary]["primary"],
+            "secondary_recommendations": RECOMMENDATIONS[row.overall_risk_summary]["secondary"],
+            "risk_chart_path": risk_chart_path(risk_parameters),
+        })
+    return recommendations
+
+
+def chart_png(path):
+    key = path.split("/", 1)[1].removesuffix(".png")
+    return io.BytesIO(render_risk_chart(parse_risk_chart_key(key)))
+
+
+def run(count, share_fonts, chart_source):
+    recommendations = sample_recommendations()
+    started = time.perf_counter()
+    for i in range(count):
+        recommendation = recommendations[i % len(recommendations)]
+        chart = chart_source(recommendation["risk_chart_path"])
+        pdf = build_recommendation_pdf(f"Patient {i}", recommendation, chart, share_fonts=share_fonts)
+        bytes(pdf.output())
+    elapsed = time.perf_counter() - started
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recommendation PDF generation")
+    parser.add_argument("--count", type=int, default=200)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", DeprecationWarning)
+    # Warm the chart caches so both runs measure PDF work only
+    run(1, True, risk_chart_image)
+
+    before = run(args.count, False, chart_png)
+    after = run(args.count, True, risk_chart_image)
+    print(f"before: {before:.1f} PDFs/s")
+    print(f"after:  {after:.1f} PDFs/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
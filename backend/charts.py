@@ -0,0 +1,88 @@
+# charts.py
+import io
+from functools import lru_cache
+
+from risk import RISK_SCORES
+
+RISK_PARAMETERS = ("axial_length_risk", "refraction_risk", "visual_acuity_risk")
+
+# Route prefix the frontend and the PDF builder use to ask for a chart
+RISK_CHART_PREFIX = "risk-chart/"
+
+
+def risk_chart_key(risk_parameters):
+    """Chart key for a risk_parameters dict, e.g. "High-Moderate-Low"."""
+    return "-".join(risk_parameters[name]["risk_category"] for name in RISK_PARAMETERS)
+
+
+def risk_chart_path(risk_parameters):
+    """Relative URL of the lazily rendered chart for these risk categories."""
+    return f"{RISK_CHART_PREFIX}{risk_chart_key(risk_parameters)}.png"
+
+
+def parse_risk_chart_key(key):
+    """Validate a chart key; returns the category tuple or None."""
+    categories = tuple(key.split("-"))
+    if len(categories) != len(RISK_PARAMETERS) or any(c not in RISK_SCORES for c in categories):
+        return None
+    return categories
+
+
+@lru_cache(maxsize=len(RISK_SCORES) ** len(RISK_PARAMETERS))
+def render_risk_chart(categories):
+    """
+    Render the risk bar chart for a tuple of three risk categories as PNG bytes
+
+    Uses the object-oriented Figure + Agg canvas API instead of pyplot, so it
+    holds no global state and is safe to call from request threads. There
+    are only 27 category combinations, so every chart is drawn at most once.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    values = [RISK_SCORES[category] for category in categories]
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.bar(list(RISK_PARAMETERS), values, color=['green' if v == 1 else 'yellow' if v == 2 else 'red' for v in values])
+    ax.set_title('Myopia Risk Assessment')
+    ax.set_ylabel('Risk Level')
+    ax.set_ylim(0, 3)
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=len(RISK_SCORES) ** len(RISK_PARAMETERS))
+def render_risk_chart_jpeg(categories):
+    """
+    The same chart as flat RGB JPEG bytes for PDF reports
+
+    fpdf2 embeds JPEG data as-is, while an RGBA PNG is decoded and
+    recompressed for every document that uses it.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(render_risk_chart(categories))) as img:
+        buffer = io.BytesIO()
+        img.convert('RGB').save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def risk_chart_image(path):
+    """
+    Image source for a risk_chart_path: cached JPEG buffer for lazily rendered
+    charts, or the path itself for charts saved to disk by older versions
+    """
+    if path.startswith(RISK_CHART_PREFIX):
+        categories = parse_risk_chart_key(path[len(RISK_CHART_PREFIX):].removesuffix(".png"))
+        if categories is None:
+            raise ValueError(f"Unknown risk chart '{path}'")
+        return io.BytesIO(render_risk_chart_jpeg(categories))
+    return path
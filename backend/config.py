@@ -1,7 +1,144 @@
 # config.py
 import os
 
+
+def retention_limits(name, max_age_hours, max_mb, max_count):
+    """Age / size / count limits of one artifact folder, overridable per folder from env."""
+    prefix = f"RETENTION_{name.upper()}"
+    return {
+        "max_age": float(os.environ.get(f'{prefix}_MAX_AGE_HOURS', max_age_hours)) * 3600,
+        "max_bytes": int(float(os.environ.get(f'{prefix}_MAX_MB', max_mb)) * 1024 * 1024),
+        "max_count": int(os.environ.get(f'{prefix}_MAX_COUNT', max_count)),
+    }
+
+
 class Config:
     MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/myopiaDx')
     SECRET_KEY = os.environ.get('SECRET_KEY', 'myopiadx-secret-key')
-    DEBUG = os.environ.get('FLASK_DEBUG', 'True') == 'True'
\ No newline at end of file
+    DEBUG = os.environ.get('FLASK_DEBUG', 'True') == 'True'
+
+    # MongoDB connection pool and timeouts (milliseconds)
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+
+    # Password hashing: werkzeug method string with its cost parameters
+    # (e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"), the number of
+    # hashing threads and how many logins may wait for one before answering 503.
+    # Stored hashes with other parameters are upgraded on the next login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+
+    # Login tokens expire after JWT_EXPIRES_SECONDS. Verified token claims and
+    # serialized /user profiles are cached in-process for a few seconds
+    JWT_EXPIRES_SECONDS = int(os.environ.get('JWT_EXPIRES_SECONDS', '86400'))
+    TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '60'))
+    PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', '30'))
+    AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '1024'))
+
+    # Decode /detect uploads and render boxes in memory instead of going
+    # through uploads/ and runs/detect/expX
+    DETECT_IN_MEMORY = os.environ.get('DETECT_IN_MEMORY', 'True') == 'True'
+
+    # Model input size (320, 480 or 640; clients may pick one per request
+    # with ?size=), see preprocessing.py for the accuracy / latency tradeoff.
+    # Uploads are decoded near that size with JPEG DCT scaling, and
+    # optionally letterboxed into a reused per-thread buffer
+    INFER_SIZE = int(os.environ.get('INFER_SIZE', '640'))
+    PREPROCESS_DRAFT = os.environ.get('PREPROCESS_DRAFT', 'True') == 'True'
+    PREPROCESS_LETTERBOX = os.environ.get('PREPROCESS_LETTERBOX', 'False') == 'True'
+
+    # Micro-batching of /detect inference: collect up to BATCH_MAX_SIZE images
+    # or wait at most BATCH_MAX_WAIT_MS before running one forward pass
+    BATCH_INFERENCE = os.environ.get('BATCH_INFERENCE', 'False') == 'True'
+    BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+    BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '20'))
+
+    # Upload limits: whole request body (larger ones get 413) and the
+    # uncompressed size of one image inside a /detect/batch ZIP archive
+    MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', '1024'))
+    MAX_IMAGE_MB = float(os.environ.get('MAX_IMAGE_MB', '50'))
+
+    # Content-addressed cache of detection results (boxes + rendered overlay)
+    DETECTION_CACHE = os.environ.get('DETECTION_CACHE', 'True') == 'True'
+    DETECTION_CACHE_MAX_ENTRIES = int(os.environ.get('DETECTION_CACHE_MAX_ENTRIES', '256'))
+    DETECTION_CACHE_MAX_MB = float(os.environ.get('DETECTION_CACHE_MAX_MB', '64'))
+    # Optional on-disk tier, e.g. "cache/detections"; empty keeps it memory-only
+    DETECTION_CACHE_DIR = os.environ.get('DETECTION_CACHE_DIR', '')
+    # Bounds of the disk tier; the least recently used files are deleted beyond them
+    DETECTION_CACHE_DISK_MAX_ENTRIES = int(os.environ.get('DETECTION_CACHE_DISK_MAX_ENTRIES', '10000'))
+    DETECTION_CACHE_DISK_MAX_MB = float(os.environ.get('DETECTION_CACHE_DISK_MAX_MB', '1024'))
+
+    # Model loading: local yolov5 clone used by torch.hub (no network), whether
+    # to load in the background while the app already serves requests, and how
+    # many warm-up passes to run before reporting ready
+    MODEL_PATH = os.environ.get('MODEL_PATH', '../yolov5/runs/train/exp26/weights/best.pt')
+    YOLOV5_DIR = os.environ.get('YOLOV5_DIR', '../yolov5')
+    MODEL_LOAD_BACKGROUND = os.environ.get('MODEL_LOAD_BACKGROUND', 'True') == 'True'
+    MODEL_WARMUP_RUNS = int(os.environ.get('MODEL_WARMUP_RUNS', '1'))
+
+    # Model registry: MODEL_VERSION names the MODEL_PATH weights (by default
+    # after its training run, e.g. exp26); POST /models loads other runs from
+    # MODEL_RUNS_DIR/<name>/weights/best.pt. At most MODEL_MAX_LOADED
+    # versions stay in memory. The MODEL_REGISTRY_STATE file (e.g.
+    # model_registry.json, the default under gunicorn.conf.py) shares the
+    # registered and active versions between workers and restarts; an
+    # explicitly set MODEL_PATH or MODEL_VERSION overrides it
+    # at startup
+    MODEL_VERSION = os.environ.get('MODEL_VERSION') or os.path.basename(os.path.dirname(os.path.dirname(MODEL_PATH))) or 'default'
+    MODEL_RUNS_DIR = os.environ.get('MODEL_RUNS_DIR', '../yolov5/runs/train')
+    MODEL_MAX_LOADED = int(os.environ.get('MODEL_MAX_LOADED', '2'))
+    MODEL_REGISTRY_STATE = os.environ.get('MODEL_REGISTRY_STATE', '')
+    MODEL_PINNED = 'MODEL_PATH' in os.environ or 'MODEL_VERSION' in os.environ
+
+    # Inference backend for best.pt: torch (eager), torchscript, onnx or
+    # onnx-int8; the exported files are produced next to the checkpoint by
+    # export_model.py (and evaluate_quantization.py for INT8).
+    # INFERENCE_THREADS pins the intra-op thread count (0 keeps the default)
+    INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+    INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '0'))
+
+    # Production server (gunicorn -c gunicorn.conf.py wsgi:app): listen
+    # address, worker processes sharing the preloaded model, request threads
+    # per worker and the worker timeout; each worker pins torch to
+    # INFERENCE_THREADS, or to cores // WSGI_WORKERS when that is 0
+    WSGI_BIND = os.environ.get('WSGI_BIND', '0.0.0.0:5000')
+    WSGI_WORKERS = int(os.environ.get('WSGI_WORKERS', '2'))
+    WSGI_THREADS = int(os.environ.get('WSGI_THREADS', '4'))
+    WSGI_TIMEOUT = int(os.environ.get('WSGI_TIMEOUT', '120'))
+
+    # Asynchronous /jobs/detect mode: worker processes (0 disables it), the
+    # maximum number of unfinished jobs before answering 429, how long
+    # finished results are kept and the longest allowed long-poll
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '0'))
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '32'))
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', '600'))
+    JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', '30'))
+
+    # Return generated PDFs in the same response (also per request with
+    # ?stream=true) instead of writing them first and serving them later;
+    # PDF_ARCHIVE keeps a persistent copy, written in the background
+    PDF_STREAM = os.environ.get('PDF_STREAM', 'False') == 'True'
+    PDF_ARCHIVE = os.environ.get('PDF_ARCHIVE', 'True') == 'True'
+
+    # Request / stage latency histograms and model counters served on /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+
+    # Retention of generated artifacts: a background sweep every
+    # RETENTION_INTERVAL seconds removes the oldest entries of each folder
+    # beyond its age / size / count limits, never anything younger than
+    # RETENTION_MIN_AGE seconds. Only files the app wrote (named
+    # <name>_<key>) are swept; bundled samples such as uploads/*.jpg stay
+    RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'True') == 'True'
+    RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', '300'))
+    RETENTION_MIN_AGE = float(os.environ.get('RETENTION_MIN_AGE', '60'))
+    RETENTION_POLICIES = {
+        "uploads": retention_limits("uploads", 24, 1024, 1000),
+        "pdfs": retention_limits("pdfs", 72, 1024, 5000),
+        "recommendations": retention_limits("recommendations", 72, 512, 5000),
+        "runs/detect": retention_limits("runs_detect", 24, 1024, 200),
+    }
@@ -0,0 +1,219 @@
+# detection_cache.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def weights_identity(path):
+    """Cheap identity for a weights file: absolute path, size and mtime."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return os.path.abspath(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def atomic_write(path, data):
+    """Write bytes to path through a temporary file and an atomic rename."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class DetectionCache:
+    """
+    Content-addressed cache of detection results
+
+    Entries are dicts holding the detected boxes (with classes and
+    confidences) and the rendered JPEG overlay. The in-memory tier is an LRU
+    bounded by entry count and total bytes; the optional disk tier keeps
+    evicted entries around across restarts, within its own entry and byte
+    bounds. Its index is rebuilt from the files (oldest first) at startup;
+    processes sharing one directory each enforce the bounds on their view.
+    """
+
+    def __init__(
+        self, max_entries=256, max_bytes=64 * 1024 * 1024, disk_dir=None,
+        disk_max_entries=10000, disk_max_bytes=1024 * 1024 * 1024
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        # Disk tier: key -> bytes on disk, least recently used first
+        self._disk_entries = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(image_bytes, model_id, **params):
+        """Hash of the image bytes, the weights identity and the inference parameters."""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(model_id.encode("utf-8"))
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached entry for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        """Store a {"detections": [...], "overlay": bytes} entry."""
+        with self._lock:
+            self._insert(key, entry)
+        if self.disk_dir:
+            self._write_disk(key, entry)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _insert(self, key, entry):
+        size = len(entry["overlay"]) + len(json.dumps(entry["detections"]))
+        if key in self._entries:
+            self._bytes -= self._sizes[key]
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+        self._bytes += size
+
+        # Evict least recently used entries until both bounds hold
+        while len(self._entries) > self.max_entries or (self._bytes > self.max_bytes and len(self._entries) > 1):
+            old_key, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(old_key)
+            self.evictions += 1
+
+    def _disk_paths(self, key):
+        directory = os.path.join(self.disk_dir, key[:2])
+        return directory, os.path.join(directory, f"{key}.json"), os.path.join(directory, f"{key}.jpg")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        _, meta_path, overlay_path = self._disk_paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                detections = json.load(f)
+            with open(overlay_path, "rb") as f:
+                overlay = f.read()
+        except (OSError, ValueError):
+            return None
+        return {"detections": detections, "overlay": overlay}
+
+    def _write_disk(self, key, entry):
+        directory, meta_path, overlay_path = self._disk_paths(key)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Overlay first so a visible .json always has its image next to it
+            atomic_write(overlay_path, entry["overlay"])
+            meta = json.dumps(entry["detections"]).encode("utf-8")
+            atomic_write(meta_path, meta)
+        except OSError as e:
+            print(f"Detection cache disk write failed: {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = len(entry["overlay"]) + len(meta)
+            self._disk_bytes += self._disk_entries[key]
+            evicted = self._trim_disk()
+        for old_key in evicted:
+            self._remove_disk(old_key)
+
+    def _trim_disk(self):
+        """Drop least recently used disk entries from the index until both bounds hold."""
+        evicted = []
+        while len(self._disk_entries) > self.disk_max_entries or (
+            self._disk_bytes > self.disk_max_bytes and len(self._disk_entries) > 1
+        ):
+            old_key, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+            evicted.append(old_key)
+        return evicted
+
+    def _remove_disk(self, key):
+        _, meta_path, overlay_path = self._disk_paths(key)
+        # .json first, so a visible .json always has its image next to it
+        for path in (meta_path, overlay_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Detection cache disk eviction failed: {e}")
+
+    def _scan_disk(self):
+        """Index the entries already on disk, oldest first, and trim them to the bounds."""
+        found = []
+        for directory, _, files in os.walk(self.disk_dir):
+            for name in files:
+                key, ext = os.path.splitext(name)
+                if ext != ".json" or name.startswith(".tmp-"):
+                    continue
+                try:
+                    meta = os.stat(os.path.join(directory, name))
+                    overlay = os.stat(os.path.join(directory, f"{key}.jpg"))
+                except OSError:
+                    continue
+                found.append((meta.st_mtime, key, meta.st_size + overlay.st_size))
+        for _, key, size in sorted(found):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        for old_key in self._trim_disk():
+            self._remove_disk(old_key)
@@ -0,0 +1,238 @@
+# evaluate_quantization.py
+"""
+INT8 post-training quantization of the exported ONNX detector, plus a
+harness comparing accuracy, latency and memory of the fp32 and INT8 models.
+
+Usage (from backend/, after `python export_model.py --include onnx`):
+    python evaluate_quantization.py quantize --mode static
+    python evaluate_quantization.py compare --backends torch onnx onnx-int8 --output quantization.json
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from config import Config
+from export_model import box_iou
+from inference import decode_image, detections_to_list
+from model_loader import ModelLoader, backend_weights
+
+PALM_VALIDATION_IMAGES = "../PALM/Validation/images"
+PALM_VALIDATION_LABELS = "../PALM/Validation/labels"
+
+
+def letterbox(image, size=640, color=114):
+    """Resize keeping aspect ratio and pad to size x size, like YOLOv5's AutoShape."""
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_w, new_h = round(width * ratio), round(height * ratio)
+    resized = np.asarray(Image.fromarray(image).resize((new_w, new_h), Image.BILINEAR))
+    canvas = np.full((size, size, 3), color, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+class PalmCalibrationReader:
+    """ONNX Runtime CalibrationDataReader over the PALM validation images."""
+
+    def __init__(self, input_name, image_paths, size=640):
+        self.input_name = input_name
+        self.image_paths = list(image_paths)
+        self.size = size
+        self._index = 0
+
+    def get_next(self):
+        if self._index >= len(self.image_paths):
+            return None
+        with open(self.image_paths[self._index], "rb") as f:
+            image = letterbox(decode_image(f.read()), self.size)
+        self._index += 1
+        tensor = image.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return {self.input_name: tensor}
+
+    def rewind(self):
+        self._index = 0
+
+
+def quantize(weights, mode, image_paths, size=640):
+    """Write best.int8.onnx from best.onnx with static (calibrated) or dynamic INT8."""
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    fp32_path = backend_weights(weights, "onnx")
+    int8_path = backend_weights(weights, "onnx-int8")
+    if not os.path.exists(fp32_path):
+        raise FileNotFoundError(f"{fp32_path} not found, run export_model.py --include onnx first")
+
+    if mode == "dynamic":
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    else:
+        input_name = InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+        reader = PalmCalibrationReader(input_name, image_paths, size)
+        quantize_static(
+            fp32_path, int8_path, reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            weight_type=QuantType.QInt8,
+            activation_type=QuantType.QUInt8,
+        )
+    print(f"Wrote {int8_path} ({mode} INT8)")
+    return int8_path
+
+
+def load_labels(label_path, width, height):
+    """Read a YOLO label file (class x y w h, normalized) into pixel xyxy boxes."""
+    boxes = []
+    if not os.path.exists(label_path):
+        return boxes
+    with open(label_path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 5:
+                continue
+            class_id, x, y, w, h = int(parts[0]), *map(float, parts[1:])
+            boxes.append((class_id, [(x - w / 2) * width, (y - h / 2) * height,
+                                     (x + w / 2) * width, (y + h / 2) * height]))
+    return boxes
+
+
+def average_precision(predictions, ground_truth, iou_threshold):
+    """
+    VOC-style all-point interpolated AP for one class
+
+    Args:
+        predictions (list): (image_index, confidence, box) tuples
+        ground_truth (dict): image_index -> list of boxes
+    """
+    total = sum(len(boxes) for boxes in ground_truth.values())
+    if total == 0:
+        return None
+
+    matched = {index: [False] * len(boxes) for index, boxes in ground_truth.items()}
+    tp, fp = [], []
+    for index, _, box in sorted(predictions, key=lambda p: -p[1]):
+        candidates = ground_truth.get(index, [])
+        ious = [box_iou(box, gt) for gt in candidates]
+        best = int(np.argmax(ious)) if ious else -1
+        if best >= 0 and ious[best] >= iou_threshold and not matched[index][best]:
+            matched[index][best] = True
+            tp.append(1)
+            fp.append(0)
+        else:
+            tp.append(0)
+            fp.append(1)
+
+    tp, fp = np.cumsum(tp), np.cumsum(fp)
+    recall = tp / total
+    precision = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    changes = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[changes + 1] - recall[changes]) * precision[changes + 1]))
+
+
+def mean_average_precision(all_predictions, all_labels, iou_threshold=0.5):
+    classes = {c for labels in all_labels for c, _ in labels}
+    aps = []
+    for class_id in sorted(classes):
+        predictions = [(i, d["confidence"], d["box"]) for i, dets in enumerate(all_predictions)
+                       for d in dets if d["class_id"] == class_id]
+        ground_truth = {i: [box for c, box in labels if c == class_id] for i, labels in enumerate(all_labels)}
+        ap = average_precision(predictions, ground_truth, iou_threshold)
+        if ap is not None:
+            aps.append(ap)
+    return float(np.mean(aps)) if aps else 0.0
+
+
+def evaluate_backend(backend, weights, yolov5_dir, image_paths, label_dir, size, conf, threads):
+    """Run one model variant over the images; executed in its own process for a clean peak RSS."""
+    model = ModelLoader(weights, repo_dir=yolov5_dir, warmup_runs=2, warmup_size=size,
+                        backend=backend, num_threads=threads).load()
+    model.conf = conf
+
+    latencies, predictions, labels = [], [], []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            image = decode_image(f.read())
+        started = time.perf_counter()
+        results = model(image, size=size)
+        latencies.append(time.perf_counter() - started)
+        predictions.append(detections_to_list(results))
+
+        stem = os.path.splitext(os.path.basename(path))[0]
+        labels.append(load_labels(os.path.join(label_dir, f"{stem}.txt"), image.shape[1], image.shape[0]))
+
+    latencies_ms = np.array(latencies) * 1000
+    maps = [mean_average_precision(predictions, labels, t) for t in np.arange(0.5, 0.96, 0.05)]
+    return {
+        "backend": backend,
+        "images": len(image_paths),
+        "mAP50": round(maps[0], 4),
+        "mAP50_95": round(float(np.mean(maps)), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(backends, weights, yolov5_dir, image_paths, label_dir, size=640, conf=0.001, threads=0):
+    context = multiprocessing.get_context("spawn")
+    reports = []
+    for backend in backends:
+        with context.Pool(1) as pool:
+            reports.append(pool.apply(
+                evaluate_backend, (backend, weights, yolov5_dir, image_paths, label_dir, size, conf, threads)
+            ))
+
+    print(f"{'backend':<12}{'mAP50':>8}{'mAP50-95':>10}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>10}")
+    for r in reports:
+        print(f"{r['backend']:<12}{r['mAP50']:>8.4f}{r['mAP50_95']:>10.4f}"
+              f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['peak_rss_mb']:>10.1f}")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantization and fp32/INT8 comparison")
+    parser.add_argument("command", choices=["quantize", "compare"])
+    parser.add_argument("--weights", default=Config.MODEL_PATH)
+    parser.add_argument("--yolov5-dir", default=Config.YOLOV5_DIR)
+    parser.add_argument("--images", default=PALM_VALIDATION_IMAGES)
+    parser.add_argument("--labels", default=PALM_VALIDATION_LABELS, help="labels written by process_data.py")
+    parser.add_argument("--img", type=int, default=640)
+    parser.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--calibration-images", type=int, default=100)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-int8"])
+    parser.add_argument("--conf", type=float, default=0.001)
+    parser.add_argument("--threads", type=int, default=Config.INFERENCE_THREADS)
+    parser.add_argument("--output", help="write the comparison as JSON")
+    args = parser.parse_args()
+
+    image_paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")))
+    if not image_paths:
+        print(f"No images found in {args.images}")
+        return 1
+
+    if args.command == "quantize":
+        quantize(args.weights, args.mode, image_paths[:args.calibration_images], args.img)
+        return 0
+
+    reports = compare(args.backends, args.weights, args.yolov5_dir, image_paths, args.labels,
+                      args.img, args.conf, args.threads)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
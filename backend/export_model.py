@@ -0,0 +1,127 @@
+# export_model.py
+"""
+Export best.pt to TorchScript / ONNX and check that the exported graphs
+detect the same boxes as the eager PyTorch model.
+
+Usage (from backend/):
+    python export_model.py --include torchscript onnx
+    python export_model.py --include onnx --check-only
+"""
+import argparse
+import glob
+import os
+import subprocess
+import sys
+
+from config import Config
+from inference import decode_image, detections_to_list
+from model_loader import ModelLoader, backend_weights
+
+
+def export(weights, include, img_size, yolov5_dir, dynamic=True):
+    """Run yolov5's export.py for the requested formats (written next to the weights)."""
+    command = [
+        sys.executable, "export.py",
+        "--weights", os.path.abspath(weights),
+        "--include", *include,
+        "--img", str(img_size),
+        "--device", "cpu",
+    ]
+    if dynamic:
+        # Dynamic batch axis so the micro-batcher can send more than one image
+        command.append("--dynamic")
+    subprocess.run(command, cwd=yolov5_dir, check=True)
+
+
+def box_iou(a, b):
+    """IoU of two xyxy boxes."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(reference, candidate, min_iou=0.9, conf_tolerance=0.05):
+    """
+    Greedily match candidate boxes to reference boxes of the same class
+
+    Returns:
+        list: Human-readable mismatches; empty when the detections agree
+    """
+    mismatches = []
+    unmatched = list(candidate)
+    for ref in reference:
+        best, best_iou = None, 0.0
+        for cand in unmatched:
+            if cand["class_id"] != ref["class_id"]:
+                continue
+            iou = box_iou(ref["box"], cand["box"])
+            if iou > best_iou:
+                best, best_iou = cand, iou
+        if best is None or best_iou < min_iou:
+            mismatches.append(f"missing {ref['class_name']} box {ref['box']} (best IoU {best_iou:.3f})")
+            continue
+        unmatched.remove(best)
+        if abs(best["confidence"] - ref["confidence"]) > conf_tolerance:
+            mismatches.append(
+                f"{ref['class_name']} confidence {best['confidence']:.3f} vs {ref['confidence']:.3f}"
+            )
+    for cand in unmatched:
+        mismatches.append(f"extra {cand['class_name']} box {cand['box']}")
+    return mismatches
+
+
+def check_parity(weights, backends, image_paths, yolov5_dir, min_iou=0.9, conf_tolerance=0.05):
+    """Compare each backend against eager torch on the given images; True when all match."""
+    images = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            images.append((path, decode_image(f.read())))
+
+    reference_model = ModelLoader(weights, repo_dir=yolov5_dir, warmup_runs=0).load()
+    reference = [detections_to_list(reference_model(image)) for _, image in images]
+
+    all_ok = True
+    for backend in backends:
+        model = ModelLoader(weights, repo_dir=yolov5_dir, warmup_runs=0, backend=backend).load()
+        failures = 0
+        for (path, image), expected in zip(images, reference):
+            mismatches = compare_detections(
+                expected, detections_to_list(model(image)), min_iou, conf_tolerance
+            )
+            if mismatches:
+                failures += 1
+                print(f"[{backend}] {os.path.basename(path)}: " + "; ".join(mismatches))
+        print(f"[{backend}] {len(images) - failures}/{len(images)} images match eager torch")
+        all_ok = all_ok and failures == 0
+    return all_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export best.pt and check backend parity")
+    parser.add_argument("--weights", default=Config.MODEL_PATH)
+    parser.add_argument("--yolov5-dir", default=Config.YOLOV5_DIR)
+    parser.add_argument("--include", nargs="+", default=["torchscript", "onnx"], choices=["torchscript", "onnx"])
+    parser.add_argument("--img", type=int, default=640)
+    parser.add_argument("--images", default="uploads/*.jpg", help="glob of images for the parity check")
+    parser.add_argument("--min-iou", type=float, default=0.9)
+    parser.add_argument("--conf-tolerance", type=float, default=0.05)
+    parser.add_argument("--check-only", action="store_true", help="skip export, only run the parity check")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export(args.weights, args.include, args.img, args.yolov5_dir)
+        for backend in args.include:
+            print(f"Exported {backend}: {backend_weights(args.weights, backend)}")
+
+    image_paths = sorted(glob.glob(args.images))
+    if not image_paths:
+        print(f"No images match {args.images}, skipping parity check")
+        return 0
+    ok = check_parity(args.weights, args.include, image_paths, args.yolov5_dir, args.min_iou, args.conf_tolerance)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+# gunicorn.conf.py
+"""
+Production launcher for the API (from backend/):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The master imports wsgi.py once (preload_app), which builds the app through
+create_app(preload=True) and reads the YOLOv5 weights before any worker is
+forked. The workers share those pages copy-on-write instead of each loading
+its own copy. gc.freeze() before every fork keeps the garbage collector from
+touching, and so copying, the preloaded objects. Threads, thread pools, the
+MongoDB client and warm-up passes are left to post_fork: thread pools and
+MongoClients do not survive fork(), and OpenMP's pool in particular must not
+be started in the master.
+
+Scaling on C cores: W workers (WSGI_WORKERS) each pin torch to T intra-op
+threads (INFERENCE_THREADS, default C // W), so W x T stays at or below C.
+    - 1 x C gives the lowest latency for one image but runs one forward
+      pass at a time
+    - C/2 x 2 or C x 1 give the highest throughput under load, at a higher
+      latency per image
+    - 2 x C/2 is a reasonable middle, e.g. 2 x 4 on 8 cores
+Every worker adds its own activations and Python heap; the weights are only
+held once. WSGI_THREADS request threads per worker overlap uploads, MongoDB
+and PDF work. Their inference calls share the worker's T threads, and
+BATCH_INFERENCE=True groups them into one forward pass. Keep JOB_WORKERS at 0
+here: the workers already are the process pool.
+"""
+import gc
+import os
+
+# Workers share registered and active model versions (POST /models, hot
+# swaps) through this file; without it a swap reaches only one worker
+os.environ.setdefault('MODEL_REGISTRY_STATE', 'model_registry.json')
+
+from config import Config
+
+bind = Config.WSGI_BIND
+workers = Config.WSGI_WORKERS
+threads = Config.WSGI_THREADS
+worker_class = "gthread"
+timeout = Config.WSGI_TIMEOUT
+preload_app = True
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset / cgroup cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def inference_threads(worker_count):
+    return Config.INFERENCE_THREADS or max(1, available_cores() // worker_count)
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app as app_module
+
+    num_threads = inference_threads(server.cfg.workers)
+    app_module.model_registry.pin_threads(num_threads)
+    app_module.start_services()
+    app_module.model_registry.warmup()
+    server.log.info(f"Worker {worker.pid}: {num_threads} inference threads")
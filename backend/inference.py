@@ -0,0 +1,58 @@
+# inference.py
+import base64
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+def decode_image(data):
+    """
+    Decode raw upload bytes straight into an RGB NumPy array (HWC)
+
+    The array is writable so YOLOv5 can draw its boxes into it during render().
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        return np.array(img.convert('RGB'))
+
+
+def run_detection(model, image, size=640):
+    """Run the YOLOv5 model on a decoded image (or list of images)."""
+    return model(image, size=size)
+
+
+def detections_to_list(results, index=0):
+    """
+    Convert the boxes of one image in a YOLOv5 Detections object to plain dicts
+
+    Returns:
+        list: One dict per box with xyxy pixel coordinates, confidence and class
+    """
+    detections = []
+    for *box, confidence, class_id in results.xyxy[index].tolist():
+        detections.append({
+            "box": [round(v, 2) for v in box],
+            "confidence": round(confidence, 4),
+            "class_id": int(class_id),
+            "class_name": results.names[int(class_id)]
+        })
+    return detections
+
+
+def render_overlay(results, index=0, quality=90, region=None):
+    """
+    Draw the detected boxes and return the annotated image as JPEG bytes;
+    region (row and column slices) crops away letterbox padding
+    """
+    annotated = results.render()[index]
+    if region is not None:
+        annotated = np.ascontiguousarray(annotated[region])
+    buffer = io.BytesIO()
+    Image.fromarray(annotated).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def jpeg_data_uri(data):
+    """Inline JPEG bytes as a data: URI the frontend can use as an <img> src."""
+    return f"data:image/jpeg;base64,{base64.b64encode(data).decode('ascii')}"
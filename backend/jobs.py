@@ -0,0 +1,197 @@
+# jobs.py
+import io
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from inference import run_detection, detections_to_list, render_overlay
+from preprocessing import Preprocessor
+from model_loader import ModelLoader
+from reports import build_detection_pdf
+from detection_cache import atomic_write
+
+# Models held by each worker process, keyed by checkpoint, least recently
+# used first: the pool initializer loads MODEL_PATH, jobs for other registry
+# versions load theirs, and beyond max_loaded the oldest is dropped
+_worker_models = OrderedDict()
+_worker_options = {}
+_worker_max_loaded = 2
+
+
+def init_worker(weights_path, repo_dir, backend, num_threads, max_loaded=2, errors=None):
+    global _worker_max_loaded
+    _worker_options.update(repo_dir=repo_dir, backend=backend, num_threads=num_threads)
+    _worker_max_loaded = max_loaded
+    try:
+        worker_model(weights_path)
+    except Exception as e:
+        # The pool only learns that a worker died, so hand the reason to the parent
+        if errors is not None:
+            errors.put(f"Loading {weights_path} failed: {e}")
+        raise
+
+
+def worker_model(weights_path):
+    """This worker's model for a checkpoint, loading it (and evicting the oldest) if needed."""
+    model = _worker_models.get(weights_path)
+    if model is None:
+        model = _worker_models[weights_path] = ModelLoader(weights_path, **_worker_options).load()
+        while len(_worker_models) > _worker_max_loaded:
+            _worker_models.popitem(last=False)
+    else:
+        _worker_models.move_to_end(weights_path)
+    return model
+
+
+def ping():
+    return True
+
+
+def run_detection_job(data, filename, patient_name, specialist_review, pdf_path, weights_path, size=640, draft=True):
+    """Inference plus PDF report for one upload with the model of weights_path; runs inside a worker process."""
+    prepared = Preprocessor(size, draft=draft)(data)
+    results = run_detection(worker_model(weights_path), prepared.image, size=size)
+    overlay = render_overlay(results)
+
+    pdf = build_detection_pdf(patient_name, filename, specialist_review, io.BytesIO(overlay))
+    atomic_write(pdf_path, bytes(pdf.output()))
+
+    return {
+        "detections": prepared.to_original(detections_to_list(results)),
+        "overlay": overlay,
+        "pdf_path": pdf_path,
+    }
+
+
+class QueueFull(Exception):
+    """Raised when the number of unfinished jobs has reached the configured limit."""
+
+
+class WorkersUnavailable(Exception):
+    """Raised when the worker pool is broken, e.g. because a worker could not load the model."""
+
+
+class JobManager:
+    """
+    Asynchronous /detect jobs on a pool of worker processes
+
+    Each worker loads the model once, and keeps up to max_loaded versions
+    for jobs that name other registry versions. Submitting returns a job id
+    right away; callers poll (or long-poll) for the result. At most
+    max_pending jobs may be unfinished at a time, beyond that submit()
+    raises QueueFull so the route can answer 429 instead of queueing
+    without bound. on_result, if
+    given, is called with the result of every successful job. A worker that
+    fails to load the model breaks the pool; submit() then raises
+    WorkersUnavailable with the loader error.
+    """
+
+    def __init__(self, weights_path, repo_dir, backend="torch", num_threads=1,
+                 workers=2, max_pending=32, result_ttl=600, max_loaded=2, on_result=None):
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.on_result = on_result
+        self.error = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+        # Fork the workers right away, before the parent imports torch or
+        # starts its own model thread, so the children start from a clean state
+        context = multiprocessing.get_context("fork")
+        self._errors = context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(weights_path, repo_dir, backend, num_threads, max_loaded, self._errors),
+        )
+        self._executor.submit(ping)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the pool and return the new job id."""
+        with self._lock:
+            self._prune()
+            if self.pending() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs already pending")
+            try:
+                future = self._executor.submit(fn, *args)
+            except BrokenProcessPool as e:
+                raise WorkersUnavailable(self.worker_error() or str(e)) from e
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "future": future,
+                "created": time.time(),
+                "finished": None,
+            }
+        self._jobs[job_id]["future"].add_done_callback(lambda _: self._mark_finished(job_id))
+        return job_id
+
+    def worker_error(self):
+        """The first error a worker reported while loading the model, or None."""
+        if self.error is None:
+            try:
+                self.error = self._errors.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return self.error
+
+    def pending(self):
+        return sum(1 for job in self._jobs.values() if not job["future"].done())
+
+    def status(self, job_id, timeout=0):
+        """
+        Status dict of a job, waiting up to timeout seconds for it to finish
+
+        Returns:
+            dict or None: None when the job id is unknown or has expired
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job["future"]
+        if timeout:
+            wait([future], timeout=timeout)
+
+        status = {"job_id": job_id, "created": job["created"]}
+        if not future.done():
+            status["status"] = "running" if future.running() else "queued"
+        elif future.exception() is not None:
+            status["status"] = "failed"
+            status["error"] = str(future.exception())
+            if isinstance(future.exception(), BrokenProcessPool):
+                status["error"] = self.worker_error() or status["error"]
+        else:
+            status["status"] = "done"
+            status["result"] = future.result()
+        return status
+
+    def stats(self):
+        with self._lock:
+            return {"jobs": len(self._jobs), "pending": self.pending(), "max_pending": self.max_pending}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _mark_finished(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job["finished"] = time.time()
+        future = job["future"]
+        if self.on_result is not None and not future.cancelled() and future.exception() is None:
+            try:
+                self.on_result(future.result())
+            except Exception as e:
+                print(f"Job {job_id} result callback failed: {e}")
+
+    def _prune(self):
+        """Forget finished jobs whose results are older than result_ttl."""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job["finished"] and job["finished"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,154 @@
+# metrics.py
+import bisect
+import contextlib
+import threading
+import time
+
+from flask import g, request
+
+# Histogram upper bounds in seconds (the Prometheus client defaults)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by route, method and status"),
+    "stage_duration_seconds": ("histogram", "Time spent in one stage of a route"),
+    "images_inferred_total": ("counter", "Images run through the detection model"),
+    "detections_total": ("counter", "Boxes returned by the detection model"),
+    "detections_per_image": ("gauge", "Average number of boxes per inferred image"),
+    "inference_duration_seconds": ("histogram", "Model latency per request and model version"),
+    "retention_bytes_reclaimed_total": ("counter", "Bytes freed by the retention sweeper per folder"),
+    "retention_entries_removed_total": ("counter", "Files or exp dirs removed by the retention sweeper per folder"),
+}
+
+# Shared do-nothing context manager returned by span() while metrics are off
+NOOP_SPAN = contextlib.nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class Metrics:
+    """
+    In-process request and stage histograms plus model counters, rendered in
+    the Prometheus text format
+
+    Routes wrap their stages in span(route, stage); init_app() adds a
+    per-request timer. When disabled no hooks are installed and span()
+    returns a shared no-op context manager, so the cost is one attribute check.
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS, prefix="myopiadx"):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            started = g.pop("metrics_started", None)
+            if started is not None:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                self.observe(
+                    "http_request_duration_seconds", time.perf_counter() - started,
+                    route=route, method=request.method, status=response.status_code
+                )
+            return response
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def span(self, route, stage):
+        """Context manager timing one stage of a route into stage_duration_seconds."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return self._span(route, stage)
+
+    @contextlib.contextmanager
+    def _span(self, route, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - started, route=route, stage=stage)
+
+    def record_inference(self, results, model=None, seconds=None):
+        """Count the images and boxes of a YOLOv5 Detections object, and time it per model version."""
+        if not self.enabled:
+            return
+        self.inc("images_inferred_total", len(results.xyxy))
+        self.inc("detections_total", sum(len(boxes) for boxes in results.xyxy))
+        if seconds is not None:
+            self.observe("inference_duration_seconds", seconds, model=model)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = dict(self._counters)
+
+        images = counters.get(("images_inferred_total", ()), 0)
+        gauges = {("detections_per_image", ()): counters.get(("detections_total", ()), 0) / images if images else 0.0}
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = METRIC_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {self.prefix}_{name} {text}")
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        for (name, labels), value in sorted({**counters, **gauges}.items()):
+            describe(name)
+            lines.append(f"{self.prefix}_{name}{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.prefix}_{name}_bucket{format_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{self.prefix}_{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{self.prefix}_{name}_count{format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
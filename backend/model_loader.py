@@ -0,0 +1,184 @@
+# model_loader.py
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Weights file suffix of each inference backend; exported graphs live next to best.pt
+BACKEND_SUFFIXES = {
+    "torch": ".pt",
+    "torchscript": ".torchscript",
+    "onnx": ".onnx",
+    "onnx-int8": ".int8.onnx",
+}
+
+
+def backend_weights(weights_path, backend):
+    """Path of the weights file a backend runs, derived from the .pt checkpoint."""
+    if backend not in BACKEND_SUFFIXES:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {sorted(BACKEND_SUFFIXES)}")
+    return str(Path(weights_path).with_suffix(BACKEND_SUFFIXES[backend]))
+
+
+class ModelNotReady(Exception):
+    """Raised when inference is requested before the model has finished loading."""
+
+
+class ModelLoader:
+    """
+    Loads the YOLOv5 detector from a local checkpoint, optionally in the background
+
+    torch is only imported inside load(), so the Flask app can start serving
+    health and auth routes while the weights are still being read. The
+    loader is callable and forwards to the loaded model once it is ready.
+
+    The backend picks which file is run: the eager best.pt, or its exported
+    TorchScript / ONNX graph (fp32, or INT8 from evaluate_quantization.py).
+    YOLOv5's DetectMultiBackend handles all of them, so every backend returns
+    the same AutoShape Detections API.
+    """
+
+    def __init__(self, weights_path, repo_dir="../yolov5", warmup_runs=1, warmup_size=640,
+                 backend="torch", num_threads=0):
+        self.backend = backend
+        self.checkpoint_path = weights_path
+        self.weights_path = backend_weights(weights_path, backend)
+        self.repo_dir = repo_dir
+        self.warmup_runs = warmup_runs
+        self.warmup_size = warmup_size
+        self.num_threads = num_threads
+
+        self.model = None
+        self.error = None
+        self.stage_timings = {}
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Load the model on a background thread and return immediately."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._load_safely, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def load(self, warmup=True):
+        """
+        Load and warm up the model on the calling thread
+
+        Args:
+            warmup (bool): Run the warm-up passes; a pre-forking server skips
+                them in the master and calls warmup() in each worker instead
+        Returns:
+            The loaded model
+        """
+        started = time.perf_counter()
+
+        stage = time.perf_counter()
+        import torch
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        self.stage_timings["import_torch"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        if os.path.isdir(self.repo_dir):
+            # Local clone of ultralytics/yolov5, so no network access is needed
+            model = torch.hub.load(self.repo_dir, "custom", path=self.weights_path, source="local")
+        else:
+            print(f"YOLOv5 repo not found at {self.repo_dir}, falling back to torch hub")
+            model = torch.hub.load("ultralytics/yolov5", "custom", path=self.weights_path)
+        if self.backend.startswith("onnx") and self.num_threads:
+            self._tune_onnx_session(model)
+        self.stage_timings["load_weights"] = time.perf_counter() - stage
+
+        if warmup:
+            self.warmup(model)
+
+        self.stage_timings["total"] = time.perf_counter() - started
+        if self._ready.is_set():
+            # use() installed a model while this one was loading; keep that one
+            return self.model
+        self.model = model
+        self._ready.set()
+
+        summary = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.stage_timings.items())
+        print(f"Model ready: {summary}")
+        return model
+
+    def warmup(self, model=None):
+        """Pay for lazy kernel and allocator setup before the first real request."""
+        if model is None:
+            model = self.get()
+        stage = time.perf_counter()
+        dummy = np.zeros((self.warmup_size, self.warmup_size, 3), dtype=np.uint8)
+        for _ in range(self.warmup_runs):
+            model(dummy, size=self.warmup_size)
+        self.stage_timings["warmup"] = time.perf_counter() - stage
+
+    def pin_threads(self, num_threads):
+        """
+        Set the intra-op thread count of this process, e.g. in every forked
+        server worker. ONNX Runtime sessions own their thread pool, which does
+        not survive fork(), so they are recreated with the new count.
+        """
+        import torch
+        self.num_threads = num_threads
+        torch.set_num_threads(num_threads)
+        if self.backend.startswith("onnx") and self.model is not None:
+            self._tune_onnx_session(self.model)
+
+    def _tune_onnx_session(self, model):
+        """Recreate the ONNX Runtime session with an explicit intra-op thread count."""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # AutoShape -> DetectMultiBackend, which only keeps the session and output names
+        model.model.session = ort.InferenceSession(self.weights_path, options, providers=["CPUExecutionProvider"])
+
+    def use(self, model):
+        """Serve an already constructed model (e.g. a stub in benchmarks) instead of loading one."""
+        self.model = model
+        self.error = None
+        self._ready.set()
+        return model
+
+    def unload(self):
+        """Drop the model; requests still holding it finish before it is freed."""
+        self._ready.clear()
+        self.model = None
+        self._thread = None
+
+    def _load_safely(self):
+        try:
+            self.load()
+        except Exception as e:
+            self.error = str(e)
+            print(f"Model loading failed: {e}")
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the model is ready; returns False on timeout."""
+        return self._ready.wait(timeout)
+
+    def get(self):
+        """Return the loaded model or raise ModelNotReady."""
+        if not self._ready.is_set():
+            raise ModelNotReady(self.error or "Model is still loading")
+        return self.model
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+    def status(self):
+        return {
+            "ready": self.ready(),
+            "error": self.error,
+            "backend": self.backend,
+            "weights": self.weights_path,
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stage_timings.items()},
+        }
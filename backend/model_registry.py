@@ -0,0 +1,329 @@
+# model_registry.py
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from detection_cache import atomic_write, weights_identity
+from model_loader import ModelLoader
+
+
+class UnknownModel(Exception):
+    """Raised when a model version is not registered."""
+
+
+class ModelRegistry:
+    """
+    Named versions of the detector, one of them active, with hot swaps
+
+    Each version (e.g. a training run such as exp27) has its own ModelLoader.
+    Loading and warm-up happen on a background thread; activate() switches
+    once the version is ready, as a single reference assignment, so requests
+    that already hold the old model finish on it. Callers may also name a
+    version per request. At most max_loaded versions keep their weights in
+    memory: the least recently used inactive ones are unloaded and reload on
+    their next use. During a swap the old and the new version are both held.
+
+    With a state file the registered versions and the active one are shared
+    by all processes of a pre-forking server and survive restarts; every
+    process calls sync(), which re-reads the file once it has changed.
+    """
+
+    def __init__(self, loader_options=None, max_loaded=2, state_path=None, sync_interval=1.0):
+        self.loader_options = dict(loader_options or {})
+        self.max_loaded = max_loaded
+        self.state_path = state_path
+        self.sync_interval = sync_interval
+
+        self.active = None
+        self.pending = None
+        self.swaps = 0
+        self.evictions = 0
+        # Least recently used first
+        self._versions = OrderedDict()
+        self._identities = {}
+        self._loading = set()
+        self._evicted = set()
+        self._started = False
+        self._lock = threading.RLock()
+        self._state_mtime = None
+        self._next_sync = 0.0
+
+    def __contains__(self, name):
+        return name in self._versions
+
+    def __call__(self, *args, **kwargs):
+        """Run the active version, e.g. from the micro-batcher."""
+        return self.get()(*args, **kwargs)
+
+    def add(self, name, weights_path, activate=False):
+        """
+        Register a version; once serving has started it loads in the background
+
+        Args:
+            name (str): Version name
+            weights_path (str): The .pt checkpoint; the backend picks the file next to it
+            activate (bool): Switch to this version as soon as it is ready
+        Returns:
+            ModelLoader: The loader of the new version
+        """
+        with self._lock:
+            loader = self._add(name, weights_path)
+            if activate:
+                self._activate(name)
+            elif self._serving():
+                self.load(name)
+        self._save_state()
+        return loader
+
+    def pin(self, name, weights_path):
+        """
+        Start with name -> weights_path as the active version, whatever the
+        state file says; call before anything is loaded
+        """
+        with self._lock:
+            loader = self._versions.get(name)
+            if loader is not None and loader.checkpoint_path != weights_path:
+                if self.pending == name:
+                    self.pending = None
+                del self._versions[name]
+                del self._identities[name]
+                loader = None
+            if loader is None:
+                self._add(name, weights_path)
+            self._swap(name)
+        self._save_state()
+
+    def activate(self, name):
+        """Make a version active; returns False while it is still loading."""
+        with self._lock:
+            swapped = self._activate(name)
+        self._save_state()
+        return swapped
+
+    def remove(self, name):
+        """Unregister an inactive version and drop its weights."""
+        with self._lock:
+            self._remove(name)
+        self._save_state()
+
+    def loader(self, name=None, touch=True):
+        """ModelLoader of a version (the active one by default)."""
+        with self._lock:
+            name = name or self.active
+            if name not in self._versions:
+                raise UnknownModel(f"Unknown model version '{name}'")
+            if touch:
+                self._versions.move_to_end(name)
+            return self._versions[name]
+
+    def resolve(self, name=None):
+        """Name of the version a request for name is served by."""
+        name = name or self.active
+        if name not in self._versions:
+            raise UnknownModel(f"Unknown model version '{name}'")
+        return name
+
+    def ready(self, name=None):
+        """Whether a version can serve; an evicted version starts reloading."""
+        name = self.resolve(name)
+        loader = self.loader(name, touch=False)
+        if not loader.ready() and name in self._evicted:
+            self.load(name)
+        return loader.ready()
+
+    def get(self, name=None):
+        """The model of a version, or ModelNotReady while it loads."""
+        return self.loader(name).get()
+
+    def identity(self, name=None):
+        """Weights identity of a version, for detection cache keys."""
+        return self._identities[self.resolve(name)]
+
+    def load(self, name=None, background=True, warmup=True):
+        """
+        Load a version (the active one by default) unless it is loaded or loading
+
+        Args:
+            background (bool): Load on a new thread instead of the calling one
+            warmup (bool): Run the warm-up passes (see ModelLoader.load)
+        Returns:
+            ModelLoader: The loader of the version
+        """
+        with self._lock:
+            self._started = True
+            name = self.resolve(name)
+            loader = self._versions[name]
+            if loader.ready() or name in self._loading:
+                return loader
+            self._loading.add(name)
+            self._evicted.discard(name)
+
+        if background:
+            threading.Thread(
+                target=self._load_version, args=(name, loader, warmup), name=f"model-loader-{name}", daemon=True
+            ).start()
+        else:
+            self._load_version(name, loader, warmup, raise_errors=True)
+        return loader
+
+    def pin_threads(self, num_threads):
+        """Intra-op threads for loaded versions and for versions loaded later."""
+        self.loader_options["num_threads"] = num_threads
+        for loader in self._loaded():
+            loader.pin_threads(num_threads)
+
+    def warmup(self):
+        for loader in self._loaded():
+            loader.warmup()
+
+    def sync(self, force=False):
+        """Apply versions and activations made by other processes through the state file."""
+        if self.state_path is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+            if mtime == self._state_mtime:
+                return
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Could not read model registry state {self.state_path}: {e}")
+            return
+
+        with self._lock:
+            self._state_mtime = mtime
+            versions = state.get("versions", {})
+            for name, weights_path in versions.items():
+                if name not in self._versions:
+                    self._add(name, weights_path)
+            for name in list(self._versions):
+                if name not in versions and name not in (self.active, self.pending):
+                    self._remove(name)
+            active = state.get("active")
+            if active in self._versions and active not in (self.active, self.pending):
+                self._activate(active)
+
+    def status(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "pending": self.pending,
+                "max_loaded": self.max_loaded,
+                "swaps": self.swaps,
+                "evictions": self.evictions,
+                "versions": {
+                    name: {
+                        **loader.status(),
+                        "active": name == self.active,
+                        "loading": name in self._loading,
+                        "evicted": name in self._evicted,
+                    }
+                    for name, loader in self._versions.items()
+                },
+            }
+
+    def _add(self, name, weights_path):
+        if name in self._versions:
+            raise ValueError(f"Model version '{name}' is already registered")
+        loader = ModelLoader(weights_path, **self.loader_options)
+        self._versions[name] = loader
+        self._identities[name] = weights_identity(loader.weights_path)
+        if self.active is None:
+            self.active = name
+        return loader
+
+    def _serving(self):
+        """Whether loading has begun, so that new versions load right away."""
+        return self._started or any(loader.ready() for loader in self._versions.values())
+
+    def _activate(self, name):
+        loader = self.loader(name, touch=False)
+        current = self._versions[self.active]
+        # Swap right away when the current version has nothing to serve with meanwhile
+        if loader.ready() or not (current.ready() or self.active in self._loading):
+            self._swap(name)
+            if not loader.ready() and self._serving():
+                self.load(name)
+            return loader.ready()
+        self.pending = name
+        self.load(name)
+        return False
+
+    def _remove(self, name):
+        if name in (self.active, self.pending):
+            raise ValueError(f"Model version '{name}' is active and cannot be removed")
+        loader = self.loader(name, touch=False)
+        loader.unload()
+        del self._versions[name]
+        del self._identities[name]
+        self._evicted.discard(name)
+
+    def _swap(self, name):
+        previous, self.active = self.active, name
+        if self.pending == name:
+            self.pending = None
+        if previous != name:
+            self.swaps += 1
+            print(f"Model version {name} is now active (was {previous})")
+        self._evict()
+
+    def _loaded(self):
+        with self._lock:
+            return [loader for loader in self._versions.values() if loader.ready()]
+
+    def _evict(self, keep=None):
+        loaded = [name for name, loader in self._versions.items() if loader.ready()]
+        excess = len(loaded) - self.max_loaded
+        for name in loaded:
+            if excess <= 0:
+                break
+            if name in (self.active, self.pending, keep):
+                continue
+            self._versions[name].unload()
+            self._evicted.add(name)
+            self.evictions += 1
+            excess -= 1
+            print(f"Evicted model version {name}")
+
+    def _load_version(self, name, loader, warmup=True, raise_errors=False):
+        try:
+            loader.error = None
+            loader.load(warmup=warmup)
+        except Exception as e:
+            loader.error = str(e)
+            print(f"Loading model version {name} failed: {e}")
+            if raise_errors:
+                raise
+        finally:
+            with self._lock:
+                self._loading.discard(name)
+                if loader.ready():
+                    # A freshly loaded version counts as the most recently used
+                    self._versions.move_to_end(name)
+                    if self.pending == name:
+                        self._swap(name)
+                    else:
+                        self._evict(keep=name)
+
+    def _save_state(self):
+        if self.state_path is None:
+            return
+        with self._lock:
+            state = {
+                "active": self.pending or self.active,
+                "versions": {name: loader.checkpoint_path for name, loader in self._versions.items()},
+            }
+            try:
+                atomic_write(self.state_path, json.dumps(state, indent=2).encode("utf-8"))
+                self._state_mtime = os.stat(self.state_path).st_mtime_ns
+            except OSError as e:
+                print(f"Could not write model registry state {self.state_path}: {e}")
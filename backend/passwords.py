@@ -0,0 +1,111 @@
+# passwords.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when the number of queued hashing jobs has reached the configured limit."""
+
+
+class PasswordHasher:
+    """
+    Password hashing and verification on a small dedicated thread pool
+
+    hashlib's scrypt and PBKDF2 release the GIL, so a login storm can keep at
+    most `workers` cores busy instead of one per request thread, leaving the
+    rest for inference. Beyond max_pending queued jobs callers get HasherBusy
+    instead of waiting without bound.
+    """
+
+    STAGES = ("queue_wait", "hash", "verify")
+
+    def __init__(self, method="scrypt:32768:8:1", salt_length=16, workers=2, max_pending=64):
+        self.salt_length = salt_length
+        self.max_pending = max_pending
+        # Canonical form as werkzeug stores it, e.g. "pbkdf2" -> "pbkdf2:sha256:1000000"
+        self.method = generate_password_hash("", method, salt_length).split("$", 1)[0]
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.stage_timings = {stage: {"count": 0, "total": 0.0, "max": 0.0} for stage in self.STAGES}
+
+    def hash(self, password):
+        """Hash a password with the configured method and cost."""
+        return self._run("hash", generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, stored_hash, password):
+        """
+        Check a password against a stored hash
+
+        Returns:
+            tuple: (matches, new_hash); new_hash is a fresh hash with the current
+            parameters when the password matched but the stored hash used
+            outdated ones, else None
+        """
+        if not self._run("verify", check_password_hash, stored_hash, password):
+            return False, None
+        if not self.needs_rehash(stored_hash):
+            return True, None
+        try:
+            new_hash = self.hash(password)
+        except HasherBusy:
+            return True, None  # try again on a later login
+        with self._lock:
+            self.rehashed += 1
+        return True, new_hash
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split("$", 1)[0] != self.method
+
+    def stats(self):
+        """Method, queue depth and queue-wait / hashing latencies in milliseconds."""
+        with self._lock:
+            stages = {}
+            for stage, timing in self.stage_timings.items():
+                count = timing["count"]
+                stages[stage] = {
+                    "count": count,
+                    "avg_ms": round(timing["total"] / count * 1000, 3) if count else 0.0,
+                    "max_ms": round(timing["max"] * 1000, 3),
+                }
+            return {
+                "method": self.method,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "stages": stages,
+            }
+
+    def _run(self, stage, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy(f"{self.max_pending} password hashing jobs already pending")
+            self._pending += 1
+        queued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._pending -= 1
+                    self._record("queue_wait", started - queued)
+                    self._record(stage, finished - started)
+
+        return self._executor.submit(job).result()
+
+    def _record(self, stage, seconds):
+        timing = self.stage_timings[stage]
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
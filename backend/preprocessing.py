@@ -0,0 +1,158 @@
+# preprocessing.py
+"""
+Resolution-adaptive decoding of uploads into model inputs
+
+PALM fundus photos are about 2100 x 2000 px, while the model sees at most
+640 px. JPEGs are decoded with DCT scaling (PIL draft mode): libjpeg skips
+straight to 1/2, 1/4 or 1/8 resolution, using the smallest reduction that
+keeps the long side at or above the inference size. On the PALM images this
+roughly halves decode time and cuts the array handed to YOLOv5 by 4-16x.
+Optionally the image is also letterboxed into a square buffer that is
+preallocated once per thread and reused, with only the padding bands
+refilled.
+
+Inference size (INFER_SIZE, or ?size= per request) trades accuracy for
+latency. The model was trained at 640:
+    - 640: full accuracy, the reference latency
+    - 480: about 0.56x the pixels and model compute of 640; small lesions
+      lose some recall
+    - 320: about 0.25x the compute, for low-end screening devices; the optic
+      disc shrinks from ~300 px in the original to ~45 px, small lesions to
+      a few pixels
+Re-check recall on the PALM validation split before lowering the default:
+    python evaluate_quantization.py compare --backends torch --img 320
+"""
+import io
+import math
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Model input sides offered to clients, multiples of YOLOv5's 32 px stride
+INFER_SIZES = (320, 480, 640)
+
+# Padding value YOLOv5 uses for letterboxing
+PAD_VALUE = 114
+
+
+def check_infer_size(size):
+    """Return size as an int, or raise ValueError unless it is one of INFER_SIZES."""
+    size = int(size)
+    if size not in INFER_SIZES:
+        raise ValueError(f"Inference size must be one of {', '.join(map(str, INFER_SIZES))}")
+    return size
+
+
+class PreparedImage:
+    """
+    Model input decoded from an upload, plus the mapping back to the original
+
+    Attributes:
+        image (np.ndarray): RGB array handed to the model
+        scale (float): Original pixels per model-input pixel
+        offset (tuple): (left, top) padding added by letterboxing
+        region (tuple): Slices of image holding the picture without padding
+    """
+
+    def __init__(self, image, scale=1.0, offset=(0, 0), region=None):
+        self.image = image
+        self.scale = scale
+        self.offset = offset
+        self.region = region
+
+    def to_original(self, detections):
+        """Map detections_to_list() boxes to original image pixels, in place."""
+        left, top = self.offset
+        for detection in detections:
+            x1, y1, x2, y2 = detection["box"]
+            detection["box"] = [
+                round((x1 - left) * self.scale, 2),
+                round((y1 - top) * self.scale, 2),
+                round((x2 - left) * self.scale, 2),
+                round((y2 - top) * self.scale, 2),
+            ]
+        return detections
+
+
+def open_reduced(data, size):
+    """
+    Open image bytes as an RGB PIL image, JPEGs reduced by DCT scaling
+
+    Returns:
+        tuple: (image, scale) where scale is original pixels per returned pixel
+    """
+    img = Image.open(io.BytesIO(data))
+    full_side = max(img.size)
+    if img.format == "JPEG":
+        # draft() picks the largest 1/2, 1/4 or 1/8 reduction that keeps both
+        # requested sides, so ask for the long side to land at >= size
+        width, height = img.size
+        img.draft("RGB", (math.ceil(size * width / full_side), math.ceil(size * height / full_side)))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    return img, full_side / max(img.size)
+
+
+class Preprocessor:
+    """
+    Decodes uploads into model inputs for one inference size
+
+    Args:
+        size (int): Inference size, one of INFER_SIZES
+        draft (bool): Decode JPEGs with DCT scaling near size instead of in full
+        letterbox (bool): Resize and pad to a size x size square in a
+            per-thread buffer; the buffer is overwritten by the next reuse on
+            that thread, so YOLOv5 must be done rendering into it by then
+    """
+
+    def __init__(self, size=640, draft=True, letterbox=False, pad_value=PAD_VALUE):
+        self.size = check_infer_size(size)
+        self.draft = draft
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+        self._local = threading.local()
+
+    def __call__(self, data, reuse=True):
+        """
+        Decode upload bytes
+
+        Args:
+            data (bytes): Image file contents
+            reuse (bool): Letterbox into this thread's buffer; pass False when
+                several prepared images must stay alive at once (batches)
+        Returns:
+            PreparedImage: The model input and its mapping to the original
+        """
+        if self.draft:
+            img, scale = open_reduced(data, self.size)
+        else:
+            with Image.open(io.BytesIO(data)) as original:
+                img, scale = ImageOps.exif_transpose(original).convert("RGB"), 1.0
+
+        if not self.letterbox:
+            return PreparedImage(np.array(img), scale)
+
+        width, height = img.size
+        ratio = min(self.size / width, self.size / height)
+        new_w, new_h = round(width * ratio), round(height * ratio)
+        if (new_w, new_h) != (width, height):
+            img = img.resize((new_w, new_h), Image.BILINEAR)
+        left, top = (self.size - new_w) // 2, (self.size - new_h) // 2
+
+        canvas = self.buffer() if reuse else np.empty((self.size, self.size, 3), dtype=np.uint8)
+        # Only the padding bands are refilled; the picture overwrites the rest
+        canvas[:top] = self.pad_value
+        canvas[top + new_h:] = self.pad_value
+        canvas[top:top + new_h, :left] = self.pad_value
+        canvas[top:top + new_h, left + new_w:] = self.pad_value
+        canvas[top:top + new_h, left:left + new_w] = np.asarray(img)
+
+        region = (slice(top, top + new_h), slice(left, left + new_w))
+        return PreparedImage(canvas, scale * width / new_w, (left, top), region)
+
+    def buffer(self):
+        """This thread's size x size x 3 input buffer, allocated on first use."""
+        canvas = getattr(self._local, "canvas", None)
+        if canvas is None:
+            canvas = self._local.canvas = np.empty((self.size, self.size, 3), dtype=np.uint8)
+        return canvas
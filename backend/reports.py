@@ -0,0 +1,239 @@
+# reports.py
+import functools
+import hashlib
+import io
+import os
+import tempfile
+
+from fpdf import FPDF
+
+from detection_cache import atomic_write, weights_identity
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DejaVuSans.ttf')
+BOLD_FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DejaVuSans-Bold.ttf')
+
+# Section layout of the recommendation report:
+# (title, recommendation field, kind, start a new page when y exceeds this many mm)
+RECOMMENDATION_SECTIONS = (
+    ("Overall Risk Summary", "overall_risk_summary", "text", 260),
+    ("Risk Parameters", "risk_parameters", "parameters", 240),
+    ("Primary Recommendations", "primary_recommendations", "list", 240),
+    ("Secondary Recommendations", "secondary_recommendations", "list", 240),
+)
+
+
+def build_detection_pdf(patient_name, filename, specialist_review, image):
+    """
+    Build the pathological myopia detection report
+
+    Args:
+        patient_name (str): Patient name printed in the header
+        filename (str): Original name of the uploaded image
+        specialist_review (str): Free-text review from the specialist
+        image: Path to the annotated image or an in-memory JPEG buffer
+
+    Returns:
+        FPDF: The laid-out document, ready for output()
+    """
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.cell(200, 10, txt="Pathological Myopia Detection Results", ln=True, align='C')
+    pdf.ln(10)
+    pdf.cell(200, 10, txt=f"Patient: {patient_name}", ln=True)
+    pdf.cell(200, 10, txt=f"File: {filename}", ln=True)
+    pdf.ln(10)
+    pdf.cell(200, 10, txt="Specialist Review:", ln=True)
+    pdf.multi_cell(0, 10, txt=specialist_review)
+    pdf.ln(10)
+    pdf.cell(200, 10, txt="See result image below:", ln=True)
+    pdf.image(image, x=10, y=pdf.get_y() + 10, w=100)
+    return pdf
+
+
+def build_batch_pdf(batch_name, entries):
+    """
+    Build one combined report for a screening batch, one page per image
+
+    Args:
+        batch_name (str): Campaign or batch name printed on every page
+        entries (list): (filename, detections, overlay JPEG bytes) tuples
+
+    Returns:
+        FPDF: The laid-out document, ready for output()
+    """
+    pdf = FPDF()
+    for filename, detections, overlay in entries:
+        pdf.add_page()
+        pdf.set_font("Arial", size=12)
+        pdf.cell(200, 10, txt="Pathological Myopia Detection Results", ln=True, align='C')
+        pdf.ln(10)
+        pdf.cell(200, 10, txt=f"Batch: {batch_name}", ln=True)
+        pdf.cell(200, 10, txt=f"File: {filename}", ln=True)
+        findings = ", ".join(f"{d['class_name']} ({d['confidence']:.2f})" for d in detections)
+        pdf.multi_cell(0, 10, txt=f"Findings: {findings or 'None detected'}")
+        pdf.image(io.BytesIO(overlay), x=10, y=pdf.get_y() + 10, w=100)
+    return pdf
+
+
+# Characters every DejaVu subset keeps, so that all reports in ASCII and
+# Latin-1 share one subset; other scripts add their characters to the key
+BASE_FONT_CHARS = frozenset(
+    chr(code) for code in (*range(0x20, 0x7F), *range(0xA0, 0x100))
+) | frozenset("\u2013\u2014\u2018\u2019\u201c\u201d\u2022\u2026\u20ac")
+
+# Subsets are written here once, named after their content, so concurrent
+# workers may share them
+FONT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "myopiadx-fonts")
+
+
+def font_subset(path, text):
+    """
+    Path of a subset of the TTF at path covering every character of text
+
+    fpdf2 parses, subsets and re-encodes the whole ~700 KB DejaVu font in
+    every document it embeds it in; handing it a subset of a few hundred
+    glyphs, built once per font and character set, makes that small.
+    """
+    return _font_subset(path, frozenset(text) - BASE_FONT_CHARS)
+
+
+@functools.lru_cache(maxsize=32)
+def _font_subset(path, extra_chars):
+    from fontTools import subset, ttLib
+
+    codepoints = sorted(map(ord, BASE_FONT_CHARS | extra_chars))
+    key = hashlib.sha256(f"{weights_identity(path)}:{codepoints}".encode("utf-8")).hexdigest()[:16]
+    subset_path = os.path.join(FONT_CACHE_DIR, f"{os.path.splitext(os.path.basename(path))[0]}-{key}.ttf")
+    if not os.path.exists(subset_path):
+        font = ttLib.TTFont(path, recalcTimestamp=False)
+        options = subset.Options(
+            notdef_outline=True, recommended_glyphs=True, glyph_names=True,
+            name_IDs=["*"], name_languages=["*"], name_legacy=True
+        )
+        # FontForge timestamp, dropped by fpdf2 anyway
+        options.drop_tables.append("FFTM")
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        buffer = io.BytesIO()
+        font.save(buffer)
+        os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+        atomic_write(subset_path, buffer.getvalue())
+    return subset_path
+
+
+class RecommendationPDF(FPDF):
+    """
+    Recommendation report page template: title header, page-number footer
+    and the Unicode DejaVu fonts, resolved once instead of per set_font call
+
+    With share_fonts the regular and bold faces are cached subsets covering
+    text and bold_text (the report text drawn in each); without it the full
+    TTF files are parsed for every document.
+    """
+
+    def __init__(self, *args, share_fonts=True, text="", bold_text="", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.family = 'DejaVu'
+        try:
+            for style, path, chars in (('', FONT_PATH, text), ('B', BOLD_FONT_PATH, bold_text)):
+                self.add_font('DejaVu', style, font_subset(path, chars) if share_fonts else path)
+        except Exception as e:
+            print(f"Font loading error: {e}")
+            self.family = 'Arial'
+
+    def use_font(self, style='', size=12):
+        self.set_font(self.family, style, size)
+
+    def header(self):
+        self.set_font('Arial', 'B', 14)
+        self.cell(0, 10, 'Myopia Treatment Recommendation', 0, 1, 'C')
+        self.ln(10)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', '', 8)
+        self.cell(0, 10, f'Page {self.page_no()}/{{nb}}', 0, 0, 'C')
+
+    def paragraph(self, text):
+        """Full-width wrapped text, leaving the cursor at the left margin of the next line."""
+        self.multi_cell(self.w - 2 * self.l_margin, 10, text, new_x="LMARGIN", new_y="NEXT")
+
+
+def recommendation_section_lines(kind, value):
+    if kind == "text":
+        return [value or 'No summary available']
+    if kind == "parameters":
+        lines = []
+        for key, param in (value or {}).items():
+            if isinstance(param, dict):
+                display_value = f"{param.get('value', 'N/A')} (Risk: {param.get('risk_category', 'N/A')})"
+            else:
+                display_value = str(param)
+            lines.append(f"{key.replace('_', ' ').title()}: {display_value}")
+        return lines
+    return [f"- {item}" for item in value or []]
+
+
+def build_recommendation_pdf(patient_name, recommendation, chart_image=None, share_fonts=True):
+    """
+    Lay out the treatment recommendation report
+
+    Args:
+        patient_name (str): Patient name printed in the title
+        recommendation (dict): Output of calculate_myopia_risk()
+        chart_image: Risk chart path or in-memory image, or None to skip it
+        share_fonts (bool): Embed a cached font subset instead of the full font
+
+    Returns:
+        RecommendationPDF: The laid-out document, ready for output()
+    """
+    title = f"Myopia Treatment Recommendation for {patient_name}"
+    chart_title = "Risk Assessment Visualization"
+    sections = [
+        (section_title, kind, break_at, recommendation_section_lines(kind, recommendation.get(field)))
+        for section_title, field, kind, break_at in RECOMMENDATION_SECTIONS
+    ]
+    bold_text = "".join([title, chart_title, *(section[0] for section in sections)])
+    text = "".join(line for section in sections for line in section[3])
+
+    pdf = RecommendationPDF(
+        orientation='P', unit='mm', format='A4', share_fonts=share_fonts, text=text, bold_text=bold_text
+    )
+    pdf.alias_nb_pages()
+    pdf.add_page()
+    page_width = pdf.w - 2 * pdf.l_margin
+
+    # Patient and Document Header
+    pdf.use_font('B', 14)
+    pdf.cell(page_width, 10, title, 0, 1, 'C')
+    pdf.ln(5)
+
+    for section_title, kind, break_at, lines in sections:
+        if pdf.get_y() > break_at:
+            pdf.add_page()
+        pdf.use_font('B', 12)
+        pdf.cell(page_width, 10, section_title, 0, 1)
+        pdf.use_font('', 11)
+        for line in lines:
+            if kind != "text" and pdf.get_y() > 270:
+                pdf.add_page()
+            pdf.paragraph(line)
+        pdf.ln(5)
+
+    # Risk Chart - Always start on a new page for the chart
+    if chart_image is not None:
+        try:
+            pdf.add_page()
+            pdf.use_font('B', 12)
+            pdf.cell(page_width, 10, chart_title, 0, 1)
+
+            # Center the chart and make sure it fits properly
+            chart_width = 160  # mm
+            x_position = (page_width - chart_width) / 2 + pdf.l_margin
+            pdf.image(chart_image, x=x_position, y=pdf.get_y() + 5, w=chart_width)
+        except Exception as e:
+            print(f"Error adding risk chart to PDF: {e}")
+
+    return pdf
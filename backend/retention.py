@@ -0,0 +1,197 @@
+# retention.py
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+
+def entry_size(path):
+    """Size of a file, or of everything below a directory, in bytes."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class RetentionPolicy:
+    """
+    Limits for one artifact folder; None disables a limit
+
+    Args:
+        folder (str): Folder whose direct entries (files or exp dirs) are managed
+        max_age (float): Seconds after which an entry is removed
+        max_bytes (int): Total size above which the oldest entries are removed
+        max_count (int): Number of entries above which the oldest are removed
+    """
+
+    def __init__(self, folder, max_age=None, max_bytes=None, max_count=None):
+        self.folder = folder
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+
+
+class RetentionManager:
+    """
+    Background sweeper enforcing age / size / count limits per artifact folder
+
+    Keeps an index of live entries per folder, ordered oldest to newest.
+    Entries younger than min_age are never removed, so a sweep cannot delete
+    a file a request has just written and is about to return. When managed
+    is given, entries whose name it rejects are left alone entirely.
+    """
+
+    def __init__(self, policies, interval=300, min_age=60, metrics=None, managed=None):
+        self.policies = {policy.folder: policy for policy in policies}
+        self.interval = interval
+        self.min_age = min_age
+        self.metrics = metrics
+        self.managed = managed
+
+        self._index = {folder: OrderedDict() for folder in self.policies}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sweeps = 0
+        self.reclaimed = {folder: {"bytes": 0, "entries": 0} for folder in self.policies}
+
+        for folder in self.policies:
+            os.makedirs(folder, exist_ok=True)
+            self.discover(folder)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="retention-sweeper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def register(self, folder, path):
+        """Record a freshly written artifact as the newest entry of its folder."""
+        name = os.path.basename(os.path.normpath(path))
+        try:
+            size = entry_size(path)
+        except OSError:
+            return
+        with self._lock:
+            index = self._index[folder]
+            index[name] = (time.time(), size)
+            index.move_to_end(name)
+
+    def discover(self, folder):
+        """
+        Reconcile the index with the folder: add entries written by other
+        processes, drop vanished ones; atomic_write()'s half-written .tmp-*
+        files and names managed rejects are skipped
+        """
+        try:
+            with os.scandir(folder) as it:
+                present = {
+                    entry.name: entry for entry in it
+                    if not entry.name.startswith(".tmp-") and (self.managed is None or self.managed(entry.name))
+                }
+        except FileNotFoundError:
+            present = {}
+
+        with self._lock:
+            index = self._index[folder]
+            known = set(index)
+        new = []
+        for name in present.keys() - known:
+            try:
+                new.append((present[name].stat().st_mtime, name, entry_size(present[name].path)))
+            except OSError:
+                continue
+
+        with self._lock:
+            index = self._index[folder]
+            for name in known - present.keys():
+                index.pop(name, None)
+            merged = sorted([(mtime, name, size) for name, (mtime, size) in index.items()] + new)
+            index.clear()
+            for mtime, name, size in merged:
+                index[name] = (mtime, size)
+
+    def sweep(self):
+        """Apply every policy once; returns bytes reclaimed per folder."""
+        reclaimed = {}
+        for folder, policy in self.policies.items():
+            self.discover(folder)
+            reclaimed[folder] = sum(self._remove(folder, path, size) for path, size in self._expired(policy))
+        self.sweeps += 1
+        return reclaimed
+
+    def stats(self):
+        with self._lock:
+            folders = {}
+            for folder, index in self._index.items():
+                policy = self.policies[folder]
+                folders[folder] = {
+                    "entries": len(index),
+                    "bytes": sum(size for _, size in index.values()),
+                    "max_age": policy.max_age,
+                    "max_bytes": policy.max_bytes,
+                    "max_count": policy.max_count,
+                    "reclaimed_bytes": self.reclaimed[folder]["bytes"],
+                    "reclaimed_entries": self.reclaimed[folder]["entries"],
+                }
+            return {"sweeps": self.sweeps, "interval": self.interval, "folders": folders}
+
+    def _expired(self, policy):
+        """Entries to remove under policy, oldest first."""
+        now = time.time()
+        with self._lock:
+            entries = list(self._index[policy.folder].items())
+        count = len(entries)
+        total = sum(size for _, (_, size) in entries)
+
+        expired = []
+        for name, (mtime, size) in entries:
+            if now - mtime < self.min_age:
+                break
+            too_old = policy.max_age is not None and now - mtime > policy.max_age
+            too_many = policy.max_count is not None and count > policy.max_count
+            too_big = policy.max_bytes is not None and total > policy.max_bytes
+            if not (too_old or too_many or too_big):
+                break
+            expired.append((os.path.join(policy.folder, name), size))
+            count -= 1
+            total -= size
+        return expired
+
+    def _remove(self, folder, path, size):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            size = 0
+        except OSError as e:
+            print(f"Retention could not remove {path}: {e}")
+            return 0
+
+        with self._lock:
+            self._index[folder].pop(os.path.basename(path), None)
+            self.reclaimed[folder]["bytes"] += size
+            self.reclaimed[folder]["entries"] += 1
+        if self.metrics is not None:
+            self.metrics.inc("retention_bytes_reclaimed_total", size, folder=folder)
+            self.metrics.inc("retention_entries_removed_total", 1, folder=folder)
+        return size
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {e}")
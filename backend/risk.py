@@ -0,0 +1,179 @@
+# risk.py
+import numpy as np
+import pandas as pd
+
+RISK_SCORES = {
+    "Low": 1,
+    "Moderate": 2,
+    "High": 3
+}
+
+# Index = risk score; 0 is never produced
+RISK_CATEGORIES = np.array(["", "Low", "Moderate", "High"], dtype=object)
+
+RISK_SUMMARIES = ("Low Myopia Risk", "Moderate Myopia Risk", "High Risk Myopia Progression")
+
+# (High, Moderate) category thresholds, shared by the single-patient and the
+# batch assessment. Axial length (mm) and |refraction| (D) are risky above
+# theirs, visual acuity (decimal) below; the average score picks the summary
+AXIAL_LENGTH_THRESHOLDS = (26, 24.5)
+REFRACTION_THRESHOLDS = (6, 3)
+VISUAL_ACUITY_THRESHOLDS = (0.5, 0.8)
+SUMMARY_THRESHOLDS = (2.3, 1.7)
+
+# Treatment recommendations per overall risk summary
+RECOMMENDATIONS = {
+    "High Risk Myopia Progression": {
+        "primary": [
+            "Immediate Orthokeratology (Ortho-K) Lens Treatment",
+            "Atropine Low-Dose Therapy (0.01%)",
+            "Frequent Myopia Progression Monitoring (Every 3 months)"
+        ],
+        "secondary": [
+            "Multifocal Contact Lens Consideration",
+            "Outdoor Activity Increase (Minimum 2 hours/day)",
+            "Screen Time Reduction Strategy"
+        ]
+    },
+    "Moderate Myopia Risk": {
+        "primary": [
+            "Multifocal Soft Contact Lens Evaluation",
+            "Quarterly Eye Examinations",
+            "Blue Light Filtering Lens Options"
+        ],
+        "secondary": [
+            "Active Lifestyle Promotion",
+            "Digital Eye Strain Prevention",
+            "Potential Ortho-K Consultation"
+        ]
+    },
+    "Low Myopia Risk": {
+        "primary": [
+            "Annual Comprehensive Eye Examination",
+            "Standard Corrective Lens Prescription",
+            "Lifestyle Guidance for Eye Health"
+        ],
+        "secondary": [
+            "Vision Therapy Consultation",
+            "Nutrition Advice for Eye Health",
+            "Digital Screen Ergonomics"
+        ]
+    }
+}
+
+
+def risk_category(value, thresholds, below=False):
+    """
+    Risk category of one measurement
+
+    Args:
+        value (float): The measurement, e.g. an axial length in mm
+        thresholds (tuple): (High, Moderate) thresholds, e.g. AXIAL_LENGTH_THRESHOLDS
+        below (bool): Values under the thresholds are the risky ones (visual acuity)
+    """
+    high, moderate = thresholds
+    if below:
+        return "High" if value < high else "Moderate" if value < moderate else "Low"
+    return "High" if value > high else "Moderate" if value > moderate else "Low"
+
+
+def risk_summary(avg_risk_score):
+    """Overall risk summary for an average of RISK_SCORES."""
+    high, moderate = SUMMARY_THRESHOLDS
+    return RISK_SUMMARIES[2] if avg_risk_score > high else RISK_SUMMARIES[1] if avg_risk_score > moderate else RISK_SUMMARIES[0]
+
+
+def calculate_myopia_risk_batch(axial_length, refraction=None, visual_acuity=None):
+    """
+    Vectorized risk stratification over many patients
+
+    Uses the same thresholds as risk_category() / risk_summary(), and so
+    gives the same categories, scores and summaries as calculate_myopia_risk()
+    in app.py; check_batch_parity() verifies that.
+
+    Args:
+        axial_length: Array-like of axial lengths in mm, or a DataFrame with
+            axial_length, refraction and visual_acuity columns
+        refraction: Array-like of spherical equivalent refractions
+        visual_acuity: Array-like of decimal visual acuities
+
+    Returns:
+        pd.DataFrame: Inputs plus per-parameter risk categories, the average
+        risk score and the overall risk summary, one row per patient
+    """
+    if isinstance(axial_length, pd.DataFrame):
+        frame = axial_length
+        axial_length = frame["axial_length"].to_numpy(dtype=float)
+        refraction = frame["refraction"].to_numpy(dtype=float)
+        visual_acuity = frame["visual_acuity"].to_numpy(dtype=float)
+    else:
+        axial_length = np.asarray(axial_length, dtype=float)
+        refraction = np.asarray(refraction, dtype=float)
+        visual_acuity = np.asarray(visual_acuity, dtype=float)
+
+    def scores(values, thresholds, below=False):
+        high, moderate = thresholds
+        if below:
+            return np.select([values < high, values < moderate], [3, 2], default=1)
+        return np.select([values > high, values > moderate], [3, 2], default=1)
+
+    axial_score = scores(axial_length, AXIAL_LENGTH_THRESHOLDS)
+    refraction_score = scores(np.abs(refraction), REFRACTION_THRESHOLDS)
+    acuity_score = scores(visual_acuity, VISUAL_ACUITY_THRESHOLDS, below=True)
+
+    avg_risk_score = (axial_score + refraction_score + acuity_score) / 3
+    summary_index = scores(avg_risk_score, SUMMARY_THRESHOLDS) - 1
+
+    return pd.DataFrame({
+        "axial_length": axial_length,
+        "refraction": refraction,
+        "visual_acuity": visual_acuity,
+        "axial_length_risk": RISK_CATEGORIES[axial_score],
+        "refraction_risk": RISK_CATEGORIES[refraction_score],
+        "visual_acuity_risk": RISK_CATEGORIES[acuity_score],
+        "avg_risk_score": avg_risk_score,
+        "overall_risk_summary": np.array(RISK_SUMMARIES, dtype=object)[summary_index],
+    })
+
+
+def check_batch_parity():
+    """
+    Compare calculate_myopia_risk_batch() with the single-patient rules on
+    every combination of values at and around each threshold
+
+    Returns:
+        list: (axial_length, refraction, visual_acuity) of each mismatch
+    """
+    def around(thresholds):
+        return sorted({round(t + d, 2) for t in thresholds for d in (-0.01, 0, 0.01)})
+
+    cases = [
+        (axial, sign * refraction, acuity)
+        for axial in around(AXIAL_LENGTH_THRESHOLDS)
+        for refraction in around(REFRACTION_THRESHOLDS)
+        for sign in (1, -1)
+        for acuity in around(VISUAL_ACUITY_THRESHOLDS)
+    ]
+    batch = calculate_myopia_risk_batch(*zip(*cases))
+
+    mismatches = []
+    for case, row in zip(cases, batch.itertuples()):
+        axial, refraction, acuity = case
+        categories = (
+            risk_category(axial, AXIAL_LENGTH_THRESHOLDS),
+            risk_category(abs(refraction), REFRACTION_THRESHOLDS),
+            risk_category(acuity, VISUAL_ACUITY_THRESHOLDS, below=True),
+        )
+        summary = risk_summary(sum(RISK_SCORES[category] for category in categories) / len(categories))
+        if categories != (row.axial_length_risk, row.refraction_risk, row.visual_acuity_risk) \
+                or summary != row.overall_risk_summary:
+            mismatches.append(case)
+    return mismatches
+
+
+if __name__ == "__main__":
+    mismatches = check_batch_parity()
+    for case in mismatches:
+        print(f"Batch and single-patient risk differ for {case}")
+    print("Batch risk matches the single-patient rules" if not mismatches else f"{len(mismatches)} mismatches")
+    raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,153 @@
+# specialists.py
+import threading
+import time
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# Unique fields of a specialist account and the index enforcing each
+UNIQUE_FIELDS = {
+    "email": "email_unique",
+    "medicalId": "medicalId_unique",
+}
+
+# Fields login() needs, including the password hash
+LOGIN_PROJECTION = {
+    "password": 1,
+    "fullName": 1,
+    "email": 1,
+    "specialty": 1,
+    "hospital": 1,
+    "medicalId": 1,
+    "yearsOfExperience": 1,
+}
+
+# Everything except the password hash
+PUBLIC_PROJECTION = {"password": 0}
+
+
+def mongo_client_options(config):
+    """Pool size and timeout keyword arguments for PyMongo / MongoClient."""
+    return {
+        "maxPoolSize": config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": config.MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": config.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": config.MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+
+
+class DuplicateSpecialist(Exception):
+    """Raised when an email or medical ID is already registered."""
+
+    def __init__(self, field):
+        super().__init__(f"{field} already registered")
+        self.field = field
+
+
+class SpecialistStore:
+    """
+    Data access for the specialists collection
+
+    Uniqueness of email and medicalId is enforced by indexes, so registration
+    is a single insert instead of two lookups followed by an insert. The
+    app creates the indexes at startup, off the request path so a MongoDB
+    that is down does not hold up booting; until they exist (server
+    unreachable, or duplicates already stored) registrations fall back to
+    looking the values up first, and creation is retried every index_retry
+    seconds.
+    Works with a PyMongo database or a mongomock one, given to the
+    constructor or later to bind(). Writes to an existing specialist drop
+    its entry from profile_cache, if one is given.
+    """
+
+    def __init__(self, db=None, profile_cache=None, index_retry=60.0):
+        self.collection = None
+        self.profile_cache = profile_cache
+        self.index_retry = index_retry
+        self._index_lock = threading.Lock()
+        if db is not None:
+            self.bind(db)
+
+    def bind(self, db):
+        """Use db's specialists collection, e.g. once this process has its own client."""
+        self.collection = db.specialists
+        self._indexed = False
+        self._next_index_attempt = 0.0
+
+    def ensure_indexes(self):
+        """
+        Create the unique indexes; a no-op when they already exist
+
+        Returns:
+            bool: False when the server is unreachable or existing duplicate
+            documents prevent building an index
+        """
+        try:
+            for field, name in UNIQUE_FIELDS.items():
+                self.collection.create_index([(field, ASCENDING)], unique=True, name=name)
+            self._indexed = True
+            return True
+        except PyMongoError as e:
+            print(f"Could not create specialists indexes: {e}")
+            return False
+
+    def indexed(self):
+        """Whether the unique indexes exist, creating them if the retry interval has passed."""
+        if self._indexed:
+            return True
+        with self._index_lock:
+            if not self._indexed and time.monotonic() >= self._next_index_attempt:
+                if not self.ensure_indexes():
+                    self._next_index_attempt = time.monotonic() + self.index_retry
+        return self._indexed
+
+    def create(self, specialist):
+        """
+        Insert a new specialist document
+
+        Returns:
+            str: The new document id
+
+        Raises:
+            DuplicateSpecialist: The email or medical ID is already taken
+        """
+        if not self.indexed():
+            self._check_unique(specialist)
+        try:
+            return str(self.collection.insert_one(specialist).inserted_id)
+        except DuplicateKeyError as e:
+            raise DuplicateSpecialist(self._duplicate_field(e, specialist)) from e
+
+    def find_for_login(self, email):
+        return self.collection.find_one({"email": email}, LOGIN_PROJECTION)
+
+    def find_public(self, user_id):
+        return self.collection.find_one({"_id": user_id}, PUBLIC_PROJECTION)
+
+    def update_password(self, user_id, password_hash):
+        self.collection.update_one({"_id": user_id}, {"$set": {"password": password_hash}})
+        self._changed(user_id)
+
+    def _changed(self, user_id):
+        if self.profile_cache is not None:
+            self.profile_cache.invalidate(str(user_id))
+
+    def _check_unique(self, specialist):
+        """Check-then-insert fallback while the indexes are missing; racy, but better than nothing."""
+        for field in UNIQUE_FIELDS:
+            if self.collection.find_one({field: specialist.get(field)}, {"_id": 1}):
+                raise DuplicateSpecialist(field)
+
+    def _duplicate_field(self, error, specialist):
+        key_pattern = (error.details or {}).get("keyPattern") or {}
+        for field in UNIQUE_FIELDS:
+            if field in key_pattern:
+                return field
+        # Servers (and mongomock) that do not report the key: look it up,
+        # which only happens on this rare error path
+        for field in UNIQUE_FIELDS:
+            if self.collection.find_one({field: specialist.get(field)}, {"_id": 1}):
+                return field
+        return next(iter(UNIQUE_FIELDS))
@@ -0,0 +1,58 @@
+# streaming.py
+import hashlib
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from flask import Response, request
+
+# Single background writer for archived copies of streamed PDFs
+archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-archive")
+
+
+def archive_pdf(archive, data):
+    try:
+        archive(data)
+    except OSError as e:
+        print(f"Error archiving PDF: {e}")
+
+
+def not_modified(etag):
+    """A 304 response when If-None-Match already names etag, else None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def pdf_response(data, download_name, archive=None, headers=None, etag=None):
+    """
+    Stream an in-memory PDF back in the current response
+
+    Sets Content-Length and an ETag (answering 304 to a matching
+    If-None-Match). fpdf2 stamps the current time into every PDF, so equal
+    reports never hash equal: callers pass a key of the report's inputs as a
+    weak etag, otherwise the bytes are hashed. When archive is given,
+    archive(data) stores a persistent copy (e.g. ArtifactStore.write) on a
+    background thread so the response does not wait for the disk.
+    """
+    if archive is not None:
+        archive_executor.submit(archive_pdf, archive, data)
+
+    response = Response(data, mimetype='application/pdf')
+    try:
+        download_name.encode('ascii')
+        disposition = {'filename': download_name}
+    except UnicodeEncodeError:
+        # RFC 5987 form for non-ASCII patient names, as Flask's send_file does
+        ascii_name = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        disposition = {'filename': ascii_name, 'filename*': f"UTF-8''{quote(download_name)}"}
+    response.headers.set('Content-Disposition', 'inline', **disposition)
+    if etag:
+        response.set_etag(etag, weak=True)
+    else:
+        response.set_etag(hashlib.sha256(data).hexdigest())
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    return response.make_conditional(request)
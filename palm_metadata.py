@@ -0,0 +1,176 @@
+"""
+Merged PALM fovea localization + classification table, cached as Feather.
+
+openpyxl parsing dominates short process_data.py runs, so the two sheets of a
+split are merged once and written to <split>/.cache/palm_metadata.feather.
+Later runs memory-map that file. The cache records the size, mtime and
+SHA-256 of both sheets; when the size or mtime changes the hash decides, so
+a touched but unchanged sheet does not force a re-parse.
+
+    from palm_metadata import load_palm_metadata
+    df = load_palm_metadata("PALM/Validation")
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+CACHE_DIR = ".cache"
+CACHE_FILE = "palm_metadata.feather"
+SOURCES_KEY = b"palm_sources"
+
+# Sheet name patterns, matched case-insensitively inside a split folder
+FOVEA_PATTERN = "fovea*.xlsx"
+CLASSIFICATION_PATTERN = "classification*.xlsx"
+
+
+def find_entry(directory, *patterns):
+    """First file or folder in directory matching one of the glob patterns, any case."""
+    if not os.path.isdir(directory):
+        return None
+    entries = {name.lower(): name for name in os.listdir(directory)}
+    for pattern in patterns:
+        for lowered in sorted(entries):
+            if fnmatch.fnmatch(lowered, pattern.lower()):
+                return os.path.join(directory, entries[lowered])
+    return None
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path, sha256=None):
+    stat = os.stat(path)
+    return {
+        "name": os.path.basename(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256 or file_sha256(path),
+    }
+
+
+def sources_unchanged(recorded, paths):
+    """
+    Whether the sheets still match the fingerprints stored with the cache
+
+    Size and mtime are checked first; only when those differ is the file
+    hashed, and the cache stays valid if the content is the same.
+    """
+    if len(recorded) != len(paths):
+        return False
+    for entry, path in zip(recorded, paths):
+        stat = os.stat(path)
+        if entry["name"] != os.path.basename(path):
+            return False
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
+        if entry["size"] != stat.st_size or entry["sha256"] != file_sha256(path):
+            return False
+    return True
+
+
+def read_sheets(fovea_file, classification_file):
+    fovea_df = pd.read_excel(fovea_file)
+    class_df = pd.read_excel(classification_file)
+
+    # Merge based on image name
+    df = pd.merge(fovea_df, class_df, on='imgName')
+    df['Label'] = df['Label'].astype(int)
+    return df
+
+
+def write_cache(path, df, sources):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        SOURCES_KEY: json.dumps(sources).encode(),
+    })
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        # Uncompressed so later reads can map the columns straight from disk
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_cache(path, paths):
+    """Memory-mapped cached table, or None when missing, unreadable or stale."""
+    import pyarrow.feather as feather
+
+    if not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+        recorded = json.loads((table.schema.metadata or {}).get(SOURCES_KEY, b"[]"))
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable metadata cache {path}: {e}")
+        return None
+    if not sources_unchanged(recorded, paths):
+        return None
+    df = table.to_pandas()
+    if any(entry["mtime_ns"] != os.stat(p).st_mtime_ns for entry, p in zip(recorded, paths)):
+        # Same content, new mtime: refresh the fingerprints so the next run skips hashing
+        write_cache(path, df, [source_fingerprint(p, entry["sha256"]) for entry, p in zip(recorded, paths)])
+    return df
+
+
+def load_palm_metadata(split_dir, use_cache=True):
+    """
+    Merged fovea localization and classification labels of one PALM split
+
+    Args:
+        split_dir (str): Split folder holding the two Excel sheets
+        use_cache (bool): Read and refresh the Feather cache; False always
+            parses the sheets
+
+    Returns:
+        pd.DataFrame or None: One row per image (imgName, Fovea_X, Fovea_Y,
+        Label), None when a sheet is missing
+    """
+    fovea_file = find_entry(split_dir, FOVEA_PATTERN)
+    classification_file = find_entry(split_dir, CLASSIFICATION_PATTERN)
+    if not fovea_file or not classification_file:
+        return None
+    paths = [fovea_file, classification_file]
+    if not use_cache:
+        return read_sheets(*paths)
+
+    cache_path = os.path.join(split_dir, CACHE_DIR, CACHE_FILE)
+    try:
+        df = read_cache(cache_path, paths)
+        if df is not None:
+            return df
+    except ImportError:
+        print("pyarrow is not installed, parsing the PALM sheets without a cache")
+        return read_sheets(*paths)
+
+    sources = [source_fingerprint(p) for p in paths]
+    df = read_sheets(*paths)
+    try:
+        write_cache(cache_path, df, sources)
+    except OSError as e:
+        print(f"Could not write metadata cache {cache_path}: {e}")
+    return df
+
+
+def metadata_mtime(split_dir):
+    """Latest modification time of the split's sheets, or None when one is missing."""
+    paths = [find_entry(split_dir, FOVEA_PATTERN), find_entry(split_dir, CLASSIFICATION_PATTERN)]
+    if not all(paths):
+        return None
+    return max(os.path.getmtime(p) for p in paths)
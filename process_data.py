@@ -1,60 +1,353 @@
+"""
+Build YOLO annotations for the PALM dataset from the fovea localization and
+classification sheets, one label file per image.
+
+Every split is processed in one run. Image sizes are read from the file
+headers on a process pool, coordinates are normalized column-wise, labels
+are written atomically and images whose label is newer than both the image
+and the sheets are skipped. The sheets themselves are read through the
+Feather cache in palm_metadata.py.
+
+Boxes are centred on the fovea and sized by a pluggable strategy (see
+BOX_STRATEGIES), computed over the whole split at once and clipped to the
+image. Image sizes are cached too, so relabelling with other strategies
+takes seconds.
+
+Usage (from the repository root):
+    python process_data.py
+    python process_data.py --splits Validation --force
+    python process_data.py --strategy fixed-ratio:ratio=0.15 disc-scaled:discs=2 aspect-corrected
+"""
+import argparse
 import os
+import struct
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from PIL import Image  # For reading image dimensions
+from PIL import Image  # Fallback for non-JPEG image dimensions
+
+from palm_metadata import CACHE_DIR, find_entry, load_palm_metadata, metadata_mtime
 
 # Paths to PALM dataset folders
-image_dir = "PALM/Validation/images"
-label_dir = "PALM/Validation/labels"
-fovea_file = "PALM/Validation/Fovea Localization.xlsx"
-classification_file = "PALM/Validation/Classification Labels.xlsx"
+PALM_ROOT = "PALM"
+SPLITS = ("Training", "Validation", "Testing")
 
-# Create the labels folder if it doesn't exist
-os.makedirs(label_dir, exist_ok=True)
+# Define a fixed bounding box size (e.g., 20% of image dimensions)
+BBOX_RATIO = 0.2
 
-# Load the Excel files
-fovea_df = pd.read_excel(fovea_file)
-class_df = pd.read_excel(classification_file)
+# Optic disc diameter in pixels on a reference PALM image whose shorter side
+# is DISC_REFERENCE_PX; the disc-scaled strategy rescales it per image
+DISC_DIAMETER_PX = 300
+DISC_REFERENCE_PX = 2056
 
-# Merge fovea localization and classification labels
-df = pd.merge(fovea_df, class_df, on='imgName')  # Merge based on image name
+# Records which strategy the labels in a folder were generated with
+STAMP_FILE = ".strategy"
 
-# Ensure the 'Label' column is of integer type
-df['Label'] = df['Label'].astype(int)
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
 
-# Define a fixed bounding box size (e.g., 20% of image dimensions)
-bbox_ratio = 0.2  # 20% of the image size
-
-# Loop through rows to generate YOLO annotations
-for _, row in df.iterrows():
-    image_name = row['imgName']
-    class_id = row['Label']  # Use the numeric value (0 or 1) directly
-    fovea_x = row['Fovea_X']
-    fovea_y = row['Fovea_Y']
-
-    # Full path to the image file
-    image_path = os.path.join(image_dir, image_name)
-    if not os.path.exists(image_path):
-        print(f"Image not found: {image_path}")
-        continue
-
-    # Get image dimensions
-    with Image.open(image_path) as img:
-        image_width, image_height = img.size
-
-    # Normalize fovea coordinates
-    x_center = fovea_x / image_width
-    y_center = fovea_y / image_height
-
-    # Define bounding box dimensions (fixed size)
-    bbox_width = bbox_ratio
-    bbox_height = bbox_ratio
-
-    # Create a YOLO annotation file
-    label_file = os.path.join(label_dir, image_name.replace('.jpg', '.txt'))
-    with open(label_file, 'w') as f:
-        f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {bbox_width:.6f} {bbox_height:.6f}\n")
-
-    # Debug: Verify correct class ID assignment
-    print(f"Image: {image_name}, Class ID: {class_id}")
-
-print("YOLO annotations created successfully!")
+
+def image_size(path):
+    """
+    (width, height) of an image, read from its header
+
+    JPEG frame headers are parsed directly so the scan never decodes pixels;
+    other formats go through PIL, which also only reads the header.
+    Returns (0, 0) when the file cannot be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(2) == b"\xff\xd8":
+                while True:
+                    marker = f.read(2)
+                    if len(marker) < 2 or marker[0] != 0xFF:
+                        break
+                    if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                        continue
+                    (length,) = struct.unpack(">H", f.read(2))
+                    if marker[1] in SOF_MARKERS:
+                        height, width = struct.unpack(">xHH", f.read(5))
+                        return width, height
+                    f.seek(length - 2, os.SEEK_CUR)
+        with Image.open(path) as img:
+            return img.size
+    except (OSError, struct.error, SyntaxError):
+        return 0, 0
+
+
+def image_sizes(paths):
+    return [image_size(path) for path in paths]
+
+
+def write_label(path, line):
+    """Write a label file through a temporary file so readers never see half of it."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(line)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_labels(items):
+    for path, line in items:
+        write_label(path, line)
+    return len(items)
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def load_split(split_dir, use_cache=True):
+    """
+    Merged fovea localization and classification labels of one split
+
+    Returns:
+        pd.DataFrame or None: One row per image, None when a sheet is missing
+    """
+    df = load_palm_metadata(split_dir, use_cache=use_cache)
+    if df is None:
+        return None
+    df.attrs['sheets_mtime'] = metadata_mtime(split_dir)
+    return df
+
+
+def fixed_ratio_boxes(width, height, ratio=BBOX_RATIO):
+    """The original box: ratio of the image width by ratio of the image height."""
+    return ratio * width, ratio * height
+
+
+def disc_scaled_boxes(width, height, discs=1.5, disc_px=DISC_DIAMETER_PX, reference_px=DISC_REFERENCE_PX):
+    """Square box of `discs` optic disc diameters, the disc scaled with the image resolution."""
+    side = discs * disc_px * np.minimum(width, height) / reference_px
+    return side, side
+
+
+def aspect_corrected_boxes(width, height, ratio=BBOX_RATIO):
+    """Square box in pixels, ratio of the shorter side, for non-square fundus images."""
+    side = ratio * np.minimum(width, height)
+    return side, side
+
+
+# Box strategies: name -> function(width, height, **params) returning box
+# width and height in pixels, all arrays over the whole split
+BOX_STRATEGIES = {
+    "fixed-ratio": fixed_ratio_boxes,
+    "disc-scaled": disc_scaled_boxes,
+    "aspect-corrected": aspect_corrected_boxes,
+}
+
+
+def parse_strategy(spec):
+    """
+    Parse "name" or "name:key=value,key=value" into (name, params)
+
+    e.g. "disc-scaled:discs=2" or "fixed-ratio:ratio=0.15"
+    """
+    name, _, options = spec.partition(":")
+    if name not in BOX_STRATEGIES:
+        raise ValueError(f"Unknown box strategy '{name}' (choose from {', '.join(BOX_STRATEGIES)})")
+    params = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        params[key.strip()] = float(value)
+    return name, params
+
+
+def yolo_boxes(df, strategy="fixed-ratio", **params):
+    """
+    Normalized YOLO boxes centred on the fovea, clipped to the image bounds
+
+    Args:
+        df (pd.DataFrame): Rows with Fovea_X, Fovea_Y, imgWidth and imgHeight
+        strategy (str): Key of BOX_STRATEGIES
+
+    Returns:
+        tuple: x_center, y_center, box_width, box_height arrays in [0, 1]
+    """
+    width = df['imgWidth'].to_numpy(dtype=float)
+    height = df['imgHeight'].to_numpy(dtype=float)
+    fovea_x = df['Fovea_X'].to_numpy(dtype=float)
+    fovea_y = df['Fovea_Y'].to_numpy(dtype=float)
+    box_w, box_h = BOX_STRATEGIES[strategy](width, height, **params)
+
+    x1 = np.clip(fovea_x - box_w / 2, 0, width)
+    x2 = np.clip(fovea_x + box_w / 2, 0, width)
+    y1 = np.clip(fovea_y - box_h / 2, 0, height)
+    y2 = np.clip(fovea_y + box_h / 2, 0, height)
+    return (x1 + x2) / 2 / width, (y1 + y2) / 2 / height, (x2 - x1) / width, (y2 - y1) / height
+
+
+def yolo_lines(df, strategy="fixed-ratio", **params):
+    """
+    YOLO label lines (class id, box centre and size, six decimals each) for every row
+
+    With the default strategy the lines match the old per-row loop for any
+    box that lies inside the image.
+    """
+    columns = [np.char.mod("%.6f", values).astype(object) for values in yolo_boxes(df, strategy, **params)]
+    line = df['Label'].astype(str).to_numpy(dtype=object)
+    for column in columns:
+        line = line + " " + column
+    return line + "\n"
+
+
+def strategy_slug(spec):
+    return "".join(c if c.isalnum() else "_" for c in spec).strip("_")
+
+
+def read_stamp(label_dir):
+    try:
+        with open(os.path.join(label_dir, STAMP_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def load_image_sizes(split_dir, df, pool, use_cache=True, chunk_size=64):
+    """
+    Width and height of every present image, read from the headers
+
+    Sizes are kept in <split>/.cache/image_sizes.feather keyed by image name
+    and mtime, so relabelling with another box strategy reads no images.
+    """
+    cache_path = os.path.join(split_dir, CACHE_DIR, "image_sizes.feather")
+    mtime_ns = np.array([os.stat(p).st_mtime_ns for p in df['image_path']], dtype=np.int64)
+    sizes = pd.DataFrame({"imgName": df['imgName'].to_numpy(), "mtime_ns": mtime_ns})
+
+    cached = None
+    if use_cache and os.path.exists(cache_path):
+        try:
+            cached = pd.read_feather(cache_path)
+        except (ImportError, OSError, ValueError) as e:
+            print(f"Ignoring image size cache {cache_path}: {e}")
+    if cached is not None:
+        sizes = sizes.merge(cached, on=["imgName", "mtime_ns"], how="left")
+    else:
+        sizes["imgWidth"] = np.nan
+        sizes["imgHeight"] = np.nan
+
+    stale = sizes['imgWidth'].isna().to_numpy()
+    if stale.any():
+        paths = df['image_path'].to_numpy()[stale].tolist()
+        read = [size for part in pool.map(image_sizes, chunks(paths, chunk_size)) for size in part]
+        sizes.loc[stale, ['imgWidth', 'imgHeight']] = np.array(read, dtype=float).reshape(-1, 2)
+        if use_cache:
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                sizes.astype({"imgWidth": "int64", "imgHeight": "int64"}).to_feather(cache_path)
+            except (ImportError, OSError) as e:
+                print(f"Could not write image size cache {cache_path}: {e}")
+
+    return sizes['imgWidth'].to_numpy(dtype=np.int64), sizes['imgHeight'].to_numpy(dtype=np.int64)
+
+
+def process_split(split_dir, pool, strategies, force=False, use_cache=True, chunk_size=64):
+    """
+    Write the label files of one split for every (label_dir name, strategy spec)
+
+    Returns:
+        dict or None: Per-variant written / up-to-date counts plus the number
+        of missing images, or None when the split has no sheets
+    """
+    df = load_split(split_dir, use_cache=use_cache)
+    if df is None:
+        return None
+
+    image_dir = find_entry(split_dir, "images")
+    df['image_path'] = [os.path.join(image_dir or split_dir, name) for name in df['imgName']]
+    stems = [os.path.splitext(name)[0] + ".txt" for name in df['imgName']]
+
+    image_mtime = np.array([os.path.getmtime(p) if os.path.exists(p) else np.nan for p in df['image_path']])
+    missing = np.isnan(image_mtime)
+    for path in df.loc[missing, 'image_path']:
+        print(f"Image not found: {path}")
+
+    present = df.loc[~missing].copy()
+    present['imgWidth'], present['imgHeight'] = load_image_sizes(split_dir, present, pool, use_cache, chunk_size)
+    unreadable = ((present['imgWidth'] == 0) | (present['imgHeight'] == 0)).to_numpy()
+    for path in present.loc[unreadable, 'image_path']:
+        print(f"Could not read image size: {path}")
+    valid = np.flatnonzero(~missing)[~unreadable]
+    present = present.loc[~unreadable]
+    newest_source = np.fmax(image_mtime[valid], df.attrs['sheets_mtime'])
+
+    variants = {}
+    for label_name, spec in strategies:
+        name, params = parse_strategy(spec)
+        label_dir = os.path.join(split_dir, label_name)
+        os.makedirs(label_dir, exist_ok=True)
+        label_paths = np.array([os.path.join(label_dir, stems[i]) for i in valid], dtype=object)
+
+        if force or read_stamp(label_dir) != spec:
+            current = np.zeros(len(valid), dtype=bool)
+        else:
+            label_mtime = np.array([os.path.getmtime(p) if os.path.exists(p) else -np.inf for p in label_paths])
+            current = label_mtime >= newest_source
+
+        todo = ~current
+        written = 0
+        if todo.any():
+            lines = yolo_lines(present.loc[todo], name, **params)
+            items = list(zip(label_paths[todo], lines))
+            written = sum(pool.map(write_labels, chunks(items, chunk_size)))
+        write_label(os.path.join(label_dir, STAMP_FILE), spec + "\n")
+        variants[label_name] = {"strategy": spec, "written": written, "up_to_date": int(current.sum())}
+
+    return {
+        "images": len(df),
+        "missing": int(missing.sum()),
+        "variants": variants,
+        "class_counts": df['Label'].value_counts().sort_index().to_dict(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build YOLO annotations for the PALM splits")
+    parser.add_argument("--root", default=PALM_ROOT)
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS))
+    parser.add_argument(
+        "--strategy", nargs="+", default=["fixed-ratio"],
+        help=f"box strategies ({', '.join(BOX_STRATEGIES)}), optionally with parameters, "
+             "e.g. disc-scaled:discs=2; several write one label folder each"
+    )
+    parser.add_argument("--label-dir", default="labels", help="label folder name when a single strategy is given")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--force", action="store_true", help="rewrite labels that are already up to date")
+    parser.add_argument("--no-cache", action="store_true", help="parse the Excel sheets and images instead of the caches")
+    args = parser.parse_args()
+
+    try:
+        for spec in args.strategy:
+            parse_strategy(spec)
+    except ValueError as e:
+        parser.error(str(e))
+    if len(args.strategy) == 1:
+        strategies = [(args.label_dir, args.strategy[0])]
+    else:
+        strategies = [(f"labels_{strategy_slug(spec)}", spec) for spec in args.strategy]
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for split in args.splits:
+            split_dir = find_entry(args.root, split) or os.path.join(args.root, split)
+            summary = process_split(split_dir, pool, strategies, force=args.force, use_cache=not args.no_cache)
+            if summary is None:
+                print(f"{split}: no fovea/classification sheets in {split_dir}, skipped")
+                continue
+            print(f"{split}: {summary['images']} images, {summary['missing']} missing, classes {summary['class_counts']}")
+            for label_name, variant in summary['variants'].items():
+                print(
+                    f"  {label_name} ({variant['strategy']}): {variant['written']} written, "
+                    f"{variant['up_to_date']} up to date"
+                )
+
+    print("YOLO annotations created successfully!")
+
+
+if __name__ == "__main__":
+    main()